@@ -0,0 +1,102 @@
+import argparse
+import os
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from SudokuIO import iter_seeds, puzzle_box, write_grids
+from SudokuSolver import Puzzle
+
+__author__ = 'cablome'
+__project__ = 'SudokuSolver'
+
+# Outcome for one puzzle of a batch: its position in the input, the solved
+# cell values (None on failure), and why it failed (None on success)
+SolveResult = namedtuple('SolveResult', ['index', 'solution', 'error'])
+
+
+def solve_one(index, seed, box=3):
+    """solve a single seed, reporting failures instead of raising"""
+    try:
+        solution = Puzzle(seed, box=box).solve()
+    except Exception as e:
+        return SolveResult(index, None, "%s: %s" % (type(e).__name__, e))
+    if solution is None:
+        return SolveResult(index, None, "no solution")
+    return SolveResult(index, solution, None)
+
+
+def solve_chunk(chunk):
+    # worker entry point: one round trip to the pool per chunk of seeds
+    start, seeds, box = chunk
+    return [solve_one(start + i, seed, box) for i, seed in enumerate(seeds)]
+
+
+def chunked(puzzles, chunksize, box):
+    # (index of first seed, list of seeds, box) triples, drawn lazily from
+    # puzzles
+    puzzles = iter(puzzles)
+    start = 0
+    while True:
+        seeds = list(islice(puzzles, chunksize))
+        if not seeds:
+            return
+        yield start, seeds, box
+        start += len(seeds)
+
+
+def solve_many(puzzles, workers=None, chunksize=64, ordered=True, box=3):
+    """solve an iterable of seeds on a pool of worker processes
+
+    Yields a SolveResult per seed, in input order when ordered is true or as
+    chunks finish otherwise.  Every seed is for a board of the given box
+    size.  The workers live for the whole batch, and only a couple of chunks
+    per worker are in flight at once, so the input is consumed lazily and
+    memory stays flat however long it is.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = chunked(puzzles, chunksize, box)
+    pool = ProcessPoolExecutor(workers)
+    try:
+        pending = deque(pool.submit(solve_chunk, c) for c in islice(chunks, 2 * workers))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                done = [f for f in pending if f in finished]
+                for f in done:
+                    pending.remove(f)
+            # top the pool back up before handing results to the caller
+            for chunk in islice(chunks, len(done)):
+                pending.append(pool.submit(solve_chunk, chunk))
+            for future in done:
+                yield from future.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def solve_file(source, destination, workers=None, chunksize=64, fmt=None, out_fmt=None):
+    """solve every puzzle in a file, writing solutions out in the same order
+
+    Puzzles are read, solved, and written as a stream, so memory use does not
+    grow with the file.  The file's first puzzle sets the board size for all
+    of them.  Puzzles without a solution come out as a board of blank cells,
+    "." or "0" as the output format writes them.  Returns the number of
+    puzzles written.
+    """
+    box = puzzle_box(source, fmt)
+    results = solve_many(iter_seeds(source, fmt), workers, chunksize, box=box)
+    # unsolved boards as blanks of their own size
+    unsolved = [None] * box ** 4
+    return write_grids(destination, (r.solution or unsolved for r in results), out_fmt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a file of sudoku puzzles")
+    parser.add_argument("source", help="puzzle file (.txt/.sdm/.csv)")
+    parser.add_argument("destination", help="solution file")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=64)
+    args = parser.parse_args()
+    print(solve_file(args.source, args.destination, args.workers, args.chunksize))
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import sys
+from time import perf_counter
+
+from SudokuIO import line_box, read_lines, seed_from_line
+from SudokuSolver import Puzzle
+
+__author__ = 'cablome'
+__project__ = 'SudokuSolver'
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+# Corpus tiers, easiest first and then bigger boards; each is a
+# one-line-per-puzzle file in CORPUS_DIR
+TIERS = ("easy", "pairs_triples", "hard", "pathological", "16x16", "25x25")
+# Default allowed slowdown against the baseline before a metric counts as a
+# regression, as a fraction
+THRESHOLD = 0.5
+# Minimum length of one timing sample, in seconds
+SAMPLE_SECONDS = 0.05
+
+
+def load_tier(tier):
+    """seeds of a corpus tier, and the box size of its boards"""
+    lines = [line.strip() for line in read_lines(os.path.join(CORPUS_DIR, tier + ".txt"))]
+    lines = [line for line in lines if line and not line.startswith("#")]
+    return [seed_from_line(line) for line in lines], line_box(lines[0])
+
+
+def best_time(run, repeat, setup=None):
+    """seconds for one call of run, as the fastest of repeat samples
+
+    Each sample times enough back to back calls to last SAMPLE_SECONDS, so
+    short runs are not lost in timer noise.  setup, if given, is called before
+    each run outside the timing and its result passed to run.
+    """
+    number = 1
+    while True:
+        elapsed = time_calls(run, number, setup)
+        if elapsed >= SAMPLE_SECONDS:
+            break
+        number = max(2 * number, int(number * SAMPLE_SECONDS / max(elapsed, 1e-9)))
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, time_calls(run, number, setup))
+    return best / number
+
+
+def time_calls(run, number, setup):
+    args = [setup() for _ in range(number)] if setup is not None else [None] * number
+    start = perf_counter()
+    for arg in args:
+        run(arg)
+    return perf_counter() - start
+
+
+def settled(seed, box):
+    # a fresh puzzle with singles already done, the state the solver hands
+    # the other techniques
+    puzzle = Puzzle(seed, box=box)
+    puzzle.process_singles()
+    return puzzle
+
+
+def fresh(seed, box):
+    return Puzzle(seed, box=box)
+
+
+def technique_times(seeds, box, repeat):
+    # microseconds per puzzle for a single pass of each technique
+    techniques = {
+        "process_singles": (lambda p: p.process_singles(), fresh),
+        "reduce_r(2)": (lambda p: p.reduce_r(2), settled),
+        "reduce_r(3)": (lambda p: p.reduce_r(3), settled),
+        "reduce_r(4)": (lambda p: p.reduce_r(4), settled),
+        "process_pointing_pairs": (lambda p: p.process_pointing_pairs(), settled),
+        "process_claiming": (lambda p: p.process_claiming(), settled),
+    }
+    times = {}
+    for name, (technique, start) in techniques.items():
+        elapsed = best_time(lambda puzzles: [technique(p) for p in puzzles], repeat,
+                            lambda: [start(seed, box) for seed in seeds])
+        times[name] = 1e6 * elapsed / len(seeds)
+    return times
+
+
+def bench_tier(seeds, box, repeat):
+    construct = best_time(lambda _: [Puzzle(seed, box=box) for seed in seeds], repeat)
+    solve = best_time(lambda _: [Puzzle(seed, box=box).solve() for seed in seeds], repeat)
+    return {
+        "puzzles": len(seeds),
+        "construct_us": 1e6 * construct / len(seeds),
+        "technique_us": technique_times(seeds, box, repeat),
+        "puzzles_per_second": len(seeds) / solve,
+        "ms_per_puzzle": 1e3 * solve / len(seeds),
+    }
+
+
+def run(tiers=TIERS, repeat=5):
+    """benchmark results for the given corpus tiers, as a json-ready dict"""
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "tiers": {tier: bench_tier(*load_tier(tier), repeat) for tier in tiers},
+    }
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """regressions of results against baseline, as readable strings
+
+    Throughput may drop and times may grow by the threshold fraction before
+    they count.  Tiers or metrics missing from either side are skipped.
+    """
+    regressions = []
+    for tier, current in results["tiers"].items():
+        base = baseline.get("tiers", {}).get(tier)
+        if base is None:
+            continue
+        metrics = [("puzzles_per_second", current["puzzles_per_second"],
+                    base.get("puzzles_per_second"), True),
+                   ("construct_us", current["construct_us"], base.get("construct_us"), False)]
+        metrics += [("technique_us " + name, value, base.get("technique_us", {}).get(name), False)
+                    for name, value in current["technique_us"].items()]
+        for name, value, old, higher_is_better in metrics:
+            if not old:
+                continue
+            if higher_is_better:
+                worse = value < old * (1 - threshold)
+            else:
+                worse = value > old * (1 + threshold)
+            if worse:
+                regressions.append("%s %s: %.3g against baseline %.3g" % (tier, name, value, old))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the solver on the pinned corpus")
+    parser.add_argument("--tiers", nargs="+", choices=TIERS, default=list(TIERS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results to this json file")
+    parser.add_argument("--baseline", default=BASELINE, help="json results to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="allowed slowdown as a fraction, default %(default)s")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    results = run(args.tiers, args.repeat)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    for regression in regressions:
+        print("REGRESSION", regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
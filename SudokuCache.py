@@ -0,0 +1,269 @@
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from itertools import permutations
+
+from SudokuIO import line_from_grid
+from SudokuSolver import Puzzle
+
+__author__ = 'cablome'
+__project__ = 'SudokuSolver'
+
+# Puzzles are compared as flat grids of 81 values, 0 for a blank cell.  Two
+# puzzles are equivalent when one turns into the other by transposing,
+# permuting bands and the rows inside them, permuting stacks and the columns
+# inside them, and relabeling digits; equivalent puzzles have equivalent
+# solutions under the same transform
+BANDS = ((0, 1, 2), (3, 4, 5), (6, 7, 8))
+ROW_ORDERS = tuple(permutations(range(3)))
+
+
+def grid_from_seed(seed):
+    """flat grid of values for a seed, or None if it is not a plain puzzle"""
+    grid = [0] * 81
+    for row, column, value in seed:
+        if not (0 <= row < 9 and 0 <= column < 9 and 1 <= value <= 9) or grid[9 * row + column]:
+            return None
+        grid[9 * row + column] = value
+    return grid
+
+
+def transposed(grid):
+    return [grid[9 * (i % 9) + i // 9] for i in range(81)]
+
+
+def line_invariants(grid):
+    """a label for each row and each column that survives every transform
+
+    A row's label lists, stack by stack, the filled cells as (clues in their
+    column, how often their digit is given) pairs.  Columns get the same with
+    rows and bands swapped.
+    """
+    row_count = [sum(1 for c in range(9) if grid[9 * r + c]) for r in range(9)]
+    column_count = [sum(1 for r in range(9) if grid[9 * r + c]) for c in range(9)]
+    frequency = [0] * 10
+    for v in grid:
+        frequency[v] += 1
+    rows = [tuple(sorted(tuple(sorted((column_count[c], frequency[grid[9 * r + c]])
+                                      for c in stack if grid[9 * r + c]))
+                         for stack in BANDS)) for r in range(9)]
+    columns = [tuple(sorted(tuple(sorted((row_count[r], frequency[grid[9 * r + c]])
+                                         for r in band if grid[9 * r + c]))
+                            for band in BANDS)) for c in range(9)]
+    return rows, columns
+
+
+def signature(grid):
+    """hex key shared by all puzzles equivalent to grid
+
+    Different puzzles may share a key too; find_transform tells them apart.
+    """
+    rows, columns = line_invariants(grid)
+    by_rows = tuple(sorted(tuple(sorted(rows[r] for r in band)) for band in BANDS))
+    by_columns = tuple(sorted(tuple(sorted(columns[c] for c in band)) for band in BANDS))
+    key = repr(tuple(sorted((by_rows, by_columns))))
+    return hashlib.sha1(key.encode("ascii")).hexdigest()
+
+
+def find_transform(source, target):
+    """a transform taking grid source to grid target, or None
+
+    The transform is (transpose, rows, columns, digits): target cell (i, j)
+    holds digits[v] where v is cell (rows[i], columns[j]) of source, after
+    transposing it first if transpose is set.
+    """
+    target_rows, target_columns = line_invariants(target)
+    for transpose in (False, True):
+        grid = transposed(source) if transpose else source
+        rows, columns = line_invariants(grid)
+        if sorted(rows) != sorted(target_rows) or sorted(columns) != sorted(target_columns):
+            continue
+        for row_order in line_orders(rows, target_rows):
+            found = match_columns(grid, target, row_order, columns, target_columns)
+            if found is not None:
+                return transpose, row_order, found[0], found[1]
+    return None
+
+
+def line_orders(lines, target_lines):
+    # every band preserving order of source lines whose labels line up with
+    # the target lines
+    choices = [[[tuple(band[k] for k in order) for order in ROW_ORDERS
+                 if all(lines[band[k]] == target_lines[3 * i + n] for n, k in enumerate(order))]
+                for band in BANDS] for i in range(3)]
+    for bands in permutations(range(3)):
+        options = [choices[i][bands[i]] for i in range(3)]
+        if all(options):
+            for first in options[0]:
+                for second in options[1]:
+                    for third in options[2]:
+                        yield first + second + third
+
+
+def match_columns(grid, target, row_order, columns, target_columns):
+    # with the rows fixed, place source columns one target column at a time,
+    # checking blanks and the digit relabeling as each column goes in
+    rows = [grid[9 * r:9 * r + 9] for r in row_order]
+    order = []
+    digits = [0] * 10
+    used = [False] * 10
+
+    def place(j):
+        if j == 9:
+            return True
+        stacks = [order[j - 1] // 3] if j % 3 else \
+            [s for s in range(3) if all(c // 3 != s for c in order)]
+        for stack in stacks:
+            for c in BANDS[stack]:
+                if c in order or columns[c] != target_columns[j]:
+                    continue
+                added = []
+                for i in range(9):
+                    v, w = rows[i][c], target[9 * i + j]
+                    if (v == 0) != (w == 0):
+                        break
+                    if v == 0 or digits[v] == w:
+                        continue
+                    if digits[v] or used[w]:
+                        break
+                    digits[v] = w
+                    used[w] = True
+                    added.append(v)
+                else:
+                    order.append(c)
+                    if place(j + 1):
+                        return True
+                    order.pop()
+                for v in added:
+                    used[digits[v]] = False
+                    digits[v] = 0
+        return False
+
+    if not place(0):
+        return None
+    # digits missing from the clues may go to any value left over
+    spare = iter(w for w in range(1, 10) if not used[w])
+    return tuple(order), [d or next(spare) if v else 0 for v, d in enumerate(digits)]
+
+
+def apply_transform(grid, transform):
+    """grid with transform applied, as find_transform describes it"""
+    transpose, rows, columns, digits = transform
+    if transpose:
+        grid = transposed(grid)
+    return [digits[grid[9 * r + c]] for r in rows for c in columns]
+
+
+class SolutionCache:
+    """solves seeds through a cache of solutions keyed on equivalent puzzles
+
+    A seed that is a relabeled, permuted, or transposed copy of one solved
+    before gets its solution by mapping the stored one across, without
+    solving.  At most maxsize puzzles are kept in memory, least recently
+    used going first.  Given a path, solutions are also kept in an sqlite
+    file there and survive the process.
+    """
+
+    def __init__(self, maxsize=1024, path=None):
+        self.maxsize = maxsize
+        # signature -> list of (grid, solution) pairs, most recent last
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS solutions "
+                            "(signature TEXT, puzzle TEXT, solution TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS by_signature ON solutions (signature)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def solve(self, seed, box=3):
+        """what Puzzle(seed, box=box).solve() returns, from the cache when possible
+
+        Only 9x9 puzzles are cached; other board sizes are solved directly.
+        """
+        if box != 3:
+            return Puzzle(seed, box=box).solve()
+        grid = grid_from_seed(seed)
+        if grid is None:
+            # malformed seeds are the solver's to report
+            return Puzzle(seed).solve()
+        key = signature(grid)
+        solution = self.lookup(key, grid)
+        if solution is not None:
+            return solution[0]
+        self.misses += 1
+        solution = Puzzle(seed).solve()
+        self.store(key, grid, solution)
+        return solution
+
+    def lookup(self, key, grid):
+        # (solution,) for a known equivalent puzzle, or None
+        bucket = self.entries.get(key)
+        if bucket is not None:
+            self.entries.move_to_end(key)
+            found = self.match(bucket, grid)
+            if found is not None:
+                self.hits += 1
+                return found
+        if self.db is not None:
+            rows = self.db.execute("SELECT puzzle, solution FROM solutions WHERE signature = ?",
+                                   (key,)).fetchall()
+            stored = [([int(c) for c in puzzle.replace(".", "0")],
+                       [int(c) for c in solution] if solution else None)
+                      for puzzle, solution in rows]
+            found = self.match(stored, grid)
+            if found is not None:
+                self.disk_hits += 1
+                self.remember(key, grid, found[0])
+                return found
+        return None
+
+    @staticmethod
+    def match(bucket, grid):
+        for source, solution in bucket:
+            transform = find_transform(source, grid)
+            if transform is not None:
+                if solution is None:
+                    return None,
+                return apply_transform(solution, transform),
+        return None
+
+    def store(self, key, grid, solution):
+        self.remember(key, grid, solution)
+        if self.db is not None:
+            self.db.execute("INSERT INTO solutions VALUES (?, ?, ?)",
+                            (key, line_from_grid(grid), line_from_grid(solution) if solution else ""))
+            self.db.commit()
+
+    def remember(self, key, grid, solution):
+        self.entries.setdefault(key, []).append((grid, solution))
+        self.entries.move_to_end(key)
+        self.size += 1
+        while self.size > self.maxsize:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def stats(self):
+        """hit and miss counts as a dict"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": self.size,
+        }
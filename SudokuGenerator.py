@@ -0,0 +1,152 @@
+import argparse
+import os
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from SudokuCache import apply_transform
+from SudokuIO import line_from_seed, write_grids
+from SudokuSolver import MARK_BIT, Puzzle, SolveStats
+
+__author__ = 'cablome'
+__project__ = 'SudokuSolver'
+
+# Difficulty grades, easiest first, and the grade each technique calls for.
+# A puzzle is as hard as the hardest technique the solver needed on it
+DIFFICULTIES = ("easy", "medium", "hard", "expert")
+TECHNIQUE_DIFFICULTY = {
+    "naked singles": "easy",
+    "hidden singles": "easy",
+    "pairs": "medium",
+    "pointing pairs": "medium",
+    "claiming": "medium",
+    "triples": "hard",
+    "quads": "hard",
+    "search": "expert",
+}
+# The three grids on the diagonal share no row or column, so any filling of
+# them starts a valid grid
+DIAGONAL_CELLS = tuple((3 * g + i // 3, 3 * g + i % 3) for g in range(3) for i in range(9))
+
+# One generated puzzle: its (row, column, value) clues, the full grid it
+# came from, and its difficulty grade
+Generated = namedtuple('Generated', ['seed', 'solution', 'difficulty'])
+
+
+def random_grid(rng):
+    """a random complete grid, as a flat list of 81 values"""
+    seed = []
+    for g in range(3):
+        values = rng.sample(range(1, 10), 9)
+        seed += [cell + (v,) for cell, v in zip(DIAGONAL_CELLS[9 * g:9 * g + 9], values)]
+    grid = Puzzle(seed).solve()
+    # the solver always completes the same way, so shuffle its answer with
+    # a random transform from the cache's symmetry group
+    rows, columns = [], []
+    for order in (rows, columns):
+        for band in rng.sample(range(3), 3):
+            order += [3 * band + k for k in rng.sample(range(3), 3)]
+    digits = [0] + rng.sample(range(1, 10), 9)
+    return apply_transform(grid, (rng.random() < 0.5, rows, columns, digits))
+
+
+def stats_grade(stats):
+    # grade for a solve recorded in stats
+    worst = 0
+    for technique, counter in stats.techniques.items():
+        if counter.eliminations or counter.placements:
+            worst = max(worst, DIFFICULTIES.index(TECHNIQUE_DIFFICULTY[technique]))
+    return DIFFICULTIES[worst]
+
+
+def grade(seed):
+    """difficulty of a puzzle, or None if it has no unique solution"""
+    stats = SolveStats()
+    puzzle = Puzzle(seed, stats=stats)
+    if puzzle.count_solutions() != 1:
+        return None
+    return stats_grade(stats)
+
+
+def removal_grade(clues, index, value, logic_only):
+    """grade of the puzzle left by dropping the clue at index, or None
+
+    None means the clue has to stay: without it the solution is no longer
+    unique, or, with logic_only, no longer reached without search.  The
+    pencil marks the logical techniques leave behind are reused for the
+    uniqueness check: the puzzle stays unique exactly when forbidding the
+    dropped value there leaves no solution at all.
+    """
+    stats = SolveStats()
+    puzzle = Puzzle([c for c in clues if 9 * c[0] + c[1] != index], stats=stats)
+    puzzle.apply_techniques()
+    if not puzzle.unsolved():
+        return stats_grade(stats)
+    if logic_only:
+        return None
+    puzzle.restrict(index, ~MARK_BIT[value])
+    if puzzle.count_solutions(1):
+        return None
+    return "expert"
+
+
+def generate(difficulty=None, logic_only=False, rng=None, attempts=100):
+    """a random puzzle with a unique solution and no clue to spare
+
+    Clues are dropped from a random full grid in random order for as long as
+    the solution stays unique.  logic_only keeps every puzzle solvable by the
+    logical techniques alone.  difficulty asks for a grade from
+    DIFFICULTIES: clues are only dropped while the puzzle stays no harder,
+    and grids are tried until one ends up exactly that hard, at most
+    attempts of them.
+    """
+    if difficulty is not None and difficulty not in DIFFICULTIES:
+        raise ValueError("unknown difficulty %r" % difficulty)
+    if logic_only and difficulty == "expert":
+        raise ValueError("expert puzzles need search, which logic_only rules out")
+    rng = rng or random.Random()
+    limit = DIFFICULTIES.index(difficulty) if difficulty else len(DIFFICULTIES) - 1
+    for _ in range(attempts):
+        grid = random_grid(rng)
+        clues = [divmod(i, 9) + (v,) for i, v in enumerate(grid)]
+        current = DIFFICULTIES[0]
+        for index in rng.sample(range(81), 81):
+            found = removal_grade(clues, index, grid[index], logic_only)
+            if found is not None and DIFFICULTIES.index(found) <= limit:
+                clues = [c for c in clues if 9 * c[0] + c[1] != index]
+                current = found
+        if difficulty is None or current == difficulty:
+            return Generated(clues, grid, current)
+    raise ValueError("no %s puzzle found in %d attempts" % (difficulty, attempts))
+
+
+def generate_seeded(job):
+    # worker entry point: one puzzle from its own random seed
+    seed, difficulty, logic_only, attempts = job
+    return generate(difficulty, logic_only, random.Random(seed), attempts)
+
+
+def generate_many(count, difficulty=None, logic_only=False, workers=None, seed=None,
+                  attempts=100):
+    """yield count generated puzzles, built in parallel on worker processes
+
+    Each puzzle gets its own random seed drawn from seed, so a given seed
+    gives the same puzzles whatever the number of workers.
+    """
+    rng = random.Random(seed)
+    jobs = [(rng.getrandbits(64), difficulty, logic_only, attempts) for _ in range(count)]
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        yield from pool.map(generate_seeded, jobs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate sudoku puzzles")
+    parser.add_argument("count", type=int)
+    parser.add_argument("destination", help="puzzle file (.txt/.sdm/.csv)")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES)
+    parser.add_argument("--logic-only", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    puzzles = generate_many(args.count, args.difficulty, args.logic_only, args.workers, args.seed)
+    print(write_grids(args.destination, (line_from_seed(p.seed) for p in puzzles)))
@@ -0,0 +1,183 @@
+import csv
+import mmap
+import os
+
+__author__ = 'cablome'
+__project__ = 'SudokuSolver'
+
+# Characters standing for an empty cell in one-line puzzle strings
+BLANKS = ".0"
+# Cell values written out as blanks
+BLANK_VALUES = (None, 0, "X", ".", "0")
+# Values past 9, on boards bigger than 9x9, are letters from A for 10 on
+VALUE_SYMBOLS = "123456789ABCDEFGHIJKLMNOP"
+SYMBOL_VALUES = {c: n + 1 for n, c in enumerate(VALUE_SYMBOLS)}
+SYMBOL_VALUES.update({c.lower(): n for c, n in SYMBOL_VALUES.items()})
+VALUE_TEXT = {n + 1: c for n, c in enumerate(VALUE_SYMBOLS)}
+# Box size of the board for each length a puzzle line may have: 4x4, 9x9,
+# 16x16, and 25x25
+LINE_BOXES = {16: 2, 81: 3, 256: 4, 625: 5}
+# (row, column) of each cell in row major order
+CELL_POSITIONS = [divmod(i, 9) for i in range(81)]
+# Output lines are collected and written out in batches of this many
+WRITE_BATCH = 4096
+
+
+def seed_from_line(line):
+    """(row, column, value) seed from a one-line puzzle string
+
+    The line has 81 characters for a 9x9 board, or 16, 256, or 625 for the
+    other board sizes in LINE_BOXES; line_box() tells which.
+    """
+    cells = line_cells(line)
+    if len(cells) == 81:
+        try:
+            return [CELL_POSITIONS[i] + (int(c),) for i, c in enumerate(cells) if c not in BLANKS]
+        except ValueError:
+            raise ValueError("bad cell in puzzle line: %r" % line) from None
+    size = LINE_BOXES[len(cells)] ** 2
+    seed = [divmod(i, size) + (SYMBOL_VALUES.get(c, 0),) for i, c in enumerate(cells)
+            if c not in BLANKS]
+    if any(not 0 < value <= size for _, _, value in seed):
+        raise ValueError("bad cell in puzzle line: %r" % line)
+    return seed
+
+
+def line_cells(line):
+    # anything after the first run of whitespace is a comment or rating
+    fields = line.split(None, 1)
+    cells = fields[0] if fields else ""
+    if len(cells) not in LINE_BOXES:
+        raise ValueError("expected 16, 81, 256, or 625 cells, got %d: %r" % (len(cells), line))
+    return cells
+
+
+def line_box(line):
+    """box size of the board a puzzle string describes, 3 for 9x9"""
+    return LINE_BOXES[len(line_cells(line))]
+
+
+def line_from_seed(seed, blank=".", box=3):
+    # one-line puzzle string for a (row, column, value) seed
+    size = box * box
+    cells = [blank] * (size * size)
+    for row, column, value in seed:
+        cells[size * row + column] = VALUE_TEXT[value]
+    return "".join(cells)
+
+
+def line_from_grid(grid, blank="."):
+    # one-line string for a list of cell values, as returned by
+    # Puzzle.solve() or Puzzle.values(), or for another puzzle string.
+    # Unsolved cells and missing grids (None) are written as blanks; a
+    # missing grid is taken to be 9x9
+    if grid is None:
+        return blank * 81
+    return "".join(blank if v in BLANK_VALUES else VALUE_TEXT.get(v, str(v)) for v in grid)
+
+
+def puzzle_format(path, fmt=None):
+    # explicit format, else guessed from the file extension
+    if fmt is not None:
+        if fmt not in ("line", "sdm", "csv"):
+            raise ValueError("unknown puzzle format %r" % fmt)
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    return {".sdm": "sdm", ".csv": "csv"}.get(extension, "line")
+
+
+def read_lines(path, use_mmap=True):
+    """decoded lines of a file, one at a time, without loading it whole"""
+    with open(path, "rb") as f:
+        if use_mmap and os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for line in iter(m.readline, b""):
+                    yield line.decode("ascii")
+        else:
+            for line in f:
+                yield line.decode("ascii")
+
+
+def iter_seeds(path, fmt=None, column=0, use_mmap=True):
+    """stream seeds from a puzzle file
+
+    fmt is "line" (16, 81, 256, or 625 characters per line, "." or "0" for
+    blanks, blank lines and "#" comments skipped), "sdm" (81 digits per
+    line, "0" for blanks), or "csv" (puzzle strings in the given column,
+    selected by index or by header name).  Left as None, the format follows
+    the file extension.
+    """
+    for line in iter_puzzle_lines(path, fmt, column, use_mmap):
+        yield seed_from_line(line)
+
+
+def iter_puzzle_lines(path, fmt=None, column=0, use_mmap=True):
+    # the puzzle strings of a file, as iter_seeds reads them
+    fmt = puzzle_format(path, fmt)
+    lines = read_lines(path, use_mmap)
+    if fmt == "csv":
+        yield from csv_puzzle_lines(lines, column)
+        return
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def csv_puzzle_lines(lines, column):
+    rows = (row for row in csv.reader(lines) if row)
+    first = next(rows, None)
+    if first is None:
+        return
+    if isinstance(column, str):
+        column = first.index(column)
+    elif len(first[column].strip()) in LINE_BOXES:
+        # no header row
+        yield first[column]
+    for row in rows:
+        yield row[column]
+
+
+def puzzle_box(path, fmt=None, column=0):
+    """box size of the boards in a puzzle file, going by its first puzzle
+
+    3 for a file with no puzzles.
+    """
+    line = next(iter_puzzle_lines(path, fmt, column), None)
+    return 3 if line is None else line_box(line)
+
+
+def csv_line(item, blank):
+    # an item is one grid, or a tuple of grids with one per column
+    if isinstance(item, tuple):
+        return ",".join(line_from_grid(g, blank) for g in item)
+    return line_from_grid(item, blank)
+
+
+def write_grids(path, grids, fmt=None, header=None):
+    """stream grids out to a puzzle file, returning how many were written
+
+    Each grid is a list of cell values or None, as produced by Puzzle.solve(),
+    or a puzzle string.  For csv output each item may instead be a tuple of
+    grids, one per column.  header, if given, names the csv columns.
+    """
+    fmt = puzzle_format(path, fmt)
+    blank = "." if fmt == "line" else "0"
+    end = "\r\n" if fmt == "csv" else "\n"
+    count = 0
+    with open(path, "w", newline="") as f:
+        if header is not None:
+            f.write(",".join(header) + end)
+        batch = []
+        for item in grids:
+            if fmt == "csv":
+                batch.append(csv_line(item, blank) + end)
+            else:
+                batch.append(line_from_grid(item, blank) + end)
+            if len(batch) >= WRITE_BATCH:
+                f.writelines(batch)
+                count += len(batch)
+                batch = []
+        f.writelines(batch)
+        count += len(batch)
+    return count
@@ -0,0 +1,86 @@
+import numpy as np
+
+from SudokuSolver import ALL_MARKS, BIT_COUNT, CELL_UNITS, MARK_BIT, PEERS, UNITS, Puzzle
+
+__author__ = 'cablome'
+__project__ = 'SudokuSolver'
+
+# Boards are rows of an (N, 81) uint16 array of the same 9-bit pencil mark
+# masks Puzzle uses, and the shared index tables become gather indices
+PEER_INDEX = np.array(PEERS, dtype=np.intp)
+UNIT_INDEX = np.array(UNITS, dtype=np.intp)
+CELL_UNIT_INDEX = np.array(CELL_UNITS, dtype=np.intp)
+POPCOUNT = np.array(BIT_COUNT, dtype=np.uint8)
+# Cell value for single-mark masks, 0 for the rest
+MARK_VALUE = np.array([m.bit_length() if BIT_COUNT[m] == 1 else 0
+                       for m in range(ALL_MARKS + 1)], dtype=np.uint8)
+# Boards are propagated this many at a time to bound temporary arrays
+CHUNK = 4096
+
+
+def candidates_from_seeds(seeds):
+    """(N, 81) candidate masks with the clues of each seed filled in"""
+    candidates = np.full((len(seeds), 81), ALL_MARKS, dtype=np.uint16)
+    for board, seed in enumerate(seeds):
+        for row, column, value in seed:
+            candidates[board, 9 * row + column] = MARK_BIT[value]
+    return candidates
+
+
+def propagate(candidates):
+    """naked and hidden singles on every board at once, in place
+
+    Each pass strikes the values of single-mark cells from their peers and
+    cuts cells down to marks no other cell of a unit holds, on all boards
+    still changing.  Returns boolean arrays of the boards that ended up solved
+    and the boards that reached a contradiction; the rest have stalled.
+    """
+    broken = np.zeros(len(candidates), dtype=bool)
+    active = np.arange(len(candidates))
+    while active.size:
+        before = candidates[active]
+        # naked singles: strike every settled value from its peers, which
+        # also empties a settled cell that shares its value with a peer
+        settled = np.where(POPCOUNT[before] == 1, before, 0)
+        boards = before & ~np.bitwise_or.reduce(settled[:, PEER_INDEX], axis=2)
+        # hidden singles: marks held by exactly one cell of a unit
+        unit_marks = boards[:, UNIT_INDEX]
+        seen = np.zeros(unit_marks.shape[:2], dtype=np.uint16)
+        repeated = np.zeros_like(seen)
+        for k in range(9):
+            repeated |= seen & unit_marks[:, :, k]
+            seen |= unit_marks[:, :, k]
+        unique = seen & ~repeated
+        hidden = boards & np.bitwise_or.reduce(unique[:, CELL_UNIT_INDEX], axis=2)
+        boards = np.where(hidden != 0, hidden, boards)
+        bad = ((seen != ALL_MARKS).any(axis=1) | (boards == 0).any(axis=1)
+               | (POPCOUNT[hidden] > 1).any(axis=1))
+        candidates[active] = boards
+        broken[active[bad]] = True
+        active = active[(boards != before).any(axis=1) & ~bad]
+    solved = (POPCOUNT[candidates] == 1).all(axis=1) & ~broken
+    return solved, broken
+
+
+def solve_batch(seeds):
+    """solve a list of seeds, returning what Puzzle.solve() would for each
+
+    Singles run on all boards together as array operations.  Boards they
+    cannot finish go to the scalar solver, seeded with every cell the array
+    pass settled.
+    """
+    results = []
+    for start in range(0, len(seeds), CHUNK):
+        chunk = seeds[start:start + CHUNK]
+        candidates = candidates_from_seeds(chunk)
+        solved, broken = propagate(candidates)
+        values = MARK_VALUE[candidates]
+        for board, seed in enumerate(chunk):
+            if solved[board]:
+                results.append(values[board].tolist())
+            elif broken[board]:
+                results.append(None)
+            else:
+                settled = [divmod(i, 9) + (int(v),) for i, v in enumerate(values[board]) if v]
+                results.append(Puzzle(settled).solve())
+    return results
@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from time import perf_counter
+from urllib.parse import parse_qs, urlsplit
+
+from SudokuIO import line_box, line_from_grid, seed_from_line
+from SudokuSolver import Puzzle
+
+__author__ = 'cablome'
+__project__ = 'SudokuSolver'
+
+# Longest a single solve may run on a worker, in seconds, unless the service
+# is told otherwise
+SOLVE_TIMEOUT = 10.0
+
+
+class ServiceBusy(Exception):
+    """a SolveService turned a request away because its queue is full"""
+
+
+def solve_within(seed, box, seconds):
+    # worker entry point: solve, giving up with TimeoutError after seconds
+    puzzle = Puzzle(seed, box=box)
+    if seconds is not None:
+        puzzle.deadline = perf_counter() + seconds
+    return puzzle.solve()
+
+
+class SolveService:
+    """asyncio front end to the solver, running solves on a bounded pool
+
+    At most workers solves run at once; the rest wait their turn in the
+    event loop, up to max_pending distinct puzzles, after which requests
+    fail at once with ServiceBusy.  Requests for a puzzle already being
+    solved share that solve, each waiting on it for its own timeout.  Each
+    solve stops itself on the worker once it has taken solve_timeout, so no
+    puzzle holds a worker for longer than that.
+    """
+
+    def __init__(self, workers=None, max_pending=1024, solve_timeout=SOLVE_TIMEOUT,
+                 executor=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.solve_timeout = solve_timeout
+        self.owns_executor = executor is None
+        # workers are spawned rather than forked: a fork could copy a lock
+        # some other thread holds, such as serve_lines reading stdin
+        self.executor = executor or ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"))
+        # puzzle key -> [shared solve task, number of callers awaiting it]
+        self.in_flight = {}
+        # solves holding a worker, and futures of those waiting for one
+        self.running = 0
+        self.queue = deque()
+        self.counts = dict.fromkeys(("requests", "coalesced", "rejected", "solved", "unsolvable",
+                                     "deadlines", "errors", "timeouts", "cancelled"), 0)
+        self.peak_waiting = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.owns_executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def solve(self, seed, timeout=None, box=3):
+        """what Puzzle(seed, box=box).solve() returns, without blocking the loop
+
+        Raises asyncio.TimeoutError when no answer comes within timeout
+        seconds, TimeoutError when the solve outruns solve_timeout, and
+        ServiceBusy when the service is full.
+        """
+        self.counts["requests"] += 1
+        key = (box, tuple(sorted(tuple(cell) for cell in seed)))
+        entry = self.in_flight.get(key)
+        if entry is None:
+            if len(self.in_flight) >= self.max_pending:
+                self.counts["rejected"] += 1
+                raise ServiceBusy("%d puzzles already pending" % len(self.in_flight))
+            task = asyncio.ensure_future(self.run(seed, box))
+            entry = self.in_flight[key] = [task, 0]
+            task.add_done_callback(lambda _: self.finished(key, task))
+        else:
+            self.counts["coalesced"] += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except (TimeoutError, asyncio.TimeoutError):
+            # asyncio's own timeout is only the builtin from Python 3.11 on
+            self.counts["timeouts"] += 1
+            raise
+        except asyncio.CancelledError:
+            self.counts["cancelled"] += 1
+            raise
+        finally:
+            entry[1] -= 1
+            if not entry[1] and not task.done():
+                # nobody is left waiting for this puzzle; forget it now, so
+                # a request arriving before the task winds down starts afresh
+                task.cancel()
+                if self.in_flight.get(key) is entry:
+                    del self.in_flight[key]
+
+    def finished(self, key, task):
+        if self.in_flight.get(key, [None])[0] is task:
+            del self.in_flight[key]
+        # callers may all have gone, so collect the outcome here to keep
+        # asyncio from reporting it as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, seed, box):
+        # one shared solve: wait for a worker, then solve on it
+        loop = asyncio.get_running_loop()
+        if self.running < self.workers:
+            self.running += 1
+        else:
+            turn = loop.create_future()
+            self.queue.append(turn)
+            self.peak_waiting = max(self.peak_waiting, len(self.queue))
+            start = perf_counter()
+            try:
+                # release() hands over its worker slot
+                await turn
+            except asyncio.CancelledError:
+                if turn.cancelled():
+                    self.queue.remove(turn)
+                else:
+                    self.release()
+                raise
+            finally:
+                self.waits += 1
+                self.wait_seconds += perf_counter() - start
+        # callers coalesced onto this solve may wait longer than the one
+        # that started it, so only solve_timeout bounds the worker
+        try:
+            job = self.executor.submit(solve_within, seed, box, self.solve_timeout)
+        except Exception:
+            # a broken or shut down pool refuses the job outright
+            self.counts["errors"] += 1
+            self.release()
+            raise
+        # the slot is only free once the worker is, even if every caller
+        # has given up by then
+        job.add_done_callback(lambda _: self.release_threadsafe(loop))
+        try:
+            solution = await asyncio.wrap_future(job)
+        except TimeoutError:
+            self.counts["deadlines"] += 1
+            raise
+        except Exception:
+            self.counts["errors"] += 1
+            raise
+        self.counts["solved" if solution is not None else "unsolvable"] += 1
+        return solution
+
+    def release_threadsafe(self, loop):
+        try:
+            loop.call_soon_threadsafe(self.release)
+        except RuntimeError:
+            # the loop has closed
+            pass
+
+    def release(self):
+        # pass a worker slot to the next solve waiting for one, or free it
+        while self.queue:
+            turn = self.queue.popleft()
+            if not turn.done():
+                turn.set_result(None)
+                return
+        self.running -= 1
+
+    def stats(self):
+        """request counts and queue figures as a dict, for backpressure"""
+        result = dict(self.counts)
+        result.update({
+            "running": self.running,
+            "waiting": len(self.queue),
+            "in_flight": len(self.in_flight),
+            "peak_waiting": self.peak_waiting,
+            "mean_wait_seconds": self.wait_seconds / self.waits if self.waits else 0.0,
+        })
+        return result
+
+
+DEFAULT_SERVICE = None
+
+
+def default_service():
+    """the SolveService solve_async() uses when not given one"""
+    global DEFAULT_SERVICE
+    if DEFAULT_SERVICE is None:
+        DEFAULT_SERVICE = SolveService()
+    return DEFAULT_SERVICE
+
+
+async def solve_async(seed, timeout=None, box=3, service=None):
+    """solve a seed on a worker pool, awaitable from an event loop"""
+    return await (service or default_service()).solve(seed, timeout, box)
+
+
+async def answer_line(service, line, timeout):
+    # one line of output for one line of input: the solution, or what went
+    # wrong
+    try:
+        seed = seed_from_line(line)
+        solution = await service.solve(seed, timeout, line_box(line))
+    except (ValueError, ServiceBusy) as e:
+        return "error: %s" % e
+    except (TimeoutError, asyncio.TimeoutError):
+        return "error: timed out"
+    if solution is None:
+        return "error: no solution"
+    return line_from_grid(solution)
+
+
+async def serve_lines(service, lines, write, timeout=None):
+    """solve puzzle lines concurrently, writing answers in input order
+
+    Lines are read on a thread, so each answer is written as soon as it and
+    those before it are in, while further input is still awaited.  No more
+    lines are read while the service's queue is full.
+    """
+    loop = asyncio.get_running_loop()
+    lines = iter(lines)
+    answers = asyncio.Queue()
+    slots = asyncio.Semaphore(service.max_pending)
+
+    async def write_answers():
+        try:
+            while True:
+                task = await answers.get()
+                if task is None:
+                    return
+                write(await task)
+                slots.release()
+        finally:
+            # should writing fail, wake the reader if it waits for room
+            slots.release()
+
+    writer = asyncio.ensure_future(write_answers())
+    try:
+        while True:
+            line = await loop.run_in_executor(None, next, lines, None)
+            if line is None:
+                break
+            line = line.strip()
+            if line and not line.startswith("#"):
+                await slots.acquire()
+                if writer.done():
+                    break
+                answers.put_nowait(asyncio.ensure_future(answer_line(service, line, timeout)))
+        answers.put_nowait(None)
+        await writer
+    finally:
+        writer.cancel()
+
+
+async def handle_http(service, reader, writer):
+    # minimal HTTP/1.0: POST /solve?timeout=s with a puzzle line as the
+    # body, GET /stats
+    try:
+        try:
+            method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            length = 0
+            while True:
+                header = (await reader.readline()).decode("latin-1").strip()
+                if not header:
+                    break
+                name, _, value = header.partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            body = (await reader.readexactly(length)).decode("ascii") if length else ""
+            url = urlsplit(target)
+            if method == "GET" and url.path == "/stats":
+                status, reply = 200, service.stats()
+            elif method == "POST" and url.path == "/solve":
+                timeout = parse_qs(url.query).get("timeout")
+                try:
+                    seed = seed_from_line(body)
+                    solution = await service.solve(seed, float(timeout[0]) if timeout else None,
+                                                   line_box(body))
+                    status, reply = 200, {"solution": solution and line_from_grid(solution)}
+                except ValueError as e:
+                    status, reply = 400, {"error": str(e)}
+                except ServiceBusy as e:
+                    status, reply = 503, {"error": str(e)}
+                except (TimeoutError, asyncio.TimeoutError):
+                    status, reply = 504, {"error": "timed out"}
+                except Exception as e:
+                    # a failed worker or a broken pool still gets an answer
+                    status, reply = 500, {"error": "%s: %s" % (type(e).__name__, e)}
+            else:
+                status, reply = 404, {"error": "not found"}
+        except (ValueError, asyncio.IncompleteReadError):
+            status, reply = 400, {"error": "bad request"}
+        payload = json.dumps(reply).encode("ascii")
+        writer.write(b"HTTP/1.0 %d %s\r\nContent-Type: application/json\r\n"
+                     b"Content-Length: %d\r\n\r\n"
+                     % (status, HTTPStatus(status).phrase.encode("ascii"), len(payload)) + payload)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def main(args):
+    async with SolveService(args.workers, args.max_pending) as service:
+        if args.port is None:
+            await serve_lines(service, sys.stdin, lambda answer: print(answer, flush=True),
+                              args.timeout)
+            print(json.dumps(service.stats()), file=sys.stderr)
+            return
+        server = await asyncio.start_server(
+            lambda r, w: handle_http(service, r, w), args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stand-in solving server: puzzle lines on stdin, or HTTP with --port")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=1024)
+    parser.add_argument("--timeout", type=float, default=None, help="per puzzle, in seconds")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
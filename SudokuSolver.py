@@ -1,31 +1,207 @@
-from itertools import combinations
+import json
+import logging
+from time import perf_counter
 
 __author__ = 'cablome'
 __project__ = 'SudokuSolver'
 
+# The solver never prints; progress goes to this logger at DEBUG level, with
+# the figures attached to each record as attributes for structured handlers
+log = logging.getLogger(__name__)
+
+# Pencil marks are held as integer bitmasks, bit (n - 1) standing for value
+# n, so set algebra on marks becomes plain bitwise arithmetic.  Python ints
+# have no fixed width, so the same code serves boards with any number of
+# values
+
+
+class BitCounts:
+    # Mark count lookup for boards too big for a table of every mask
+    def __getitem__(self, mask):
+        return mask.bit_count()
+
+
+class MarkDigits(dict):
+    # Marks of a mask in ascending order, worked out the first time each
+    # mask is asked for, for boards too big for a table of every mask.  The
+    # table is shared by every puzzle of its size, so it starts afresh once
+    # it holds maxsize masks rather than grow for as long as the process runs
+    def __init__(self, maxsize=1 << 16):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __missing__(self, mask):
+        if len(self) >= self.maxsize:
+            self.clear()
+        digits = tuple(n + 1 for n in range(mask.bit_length()) if mask >> n & 1)
+        self[mask] = digits
+        return digits
+
+
+class Geometry:
+    """Index tables for a board of box x box grids, with box * box values
+
+    Every table is built once per box size and shared by all puzzles of that
+    size; see geometry().
+    """
+
+    def __init__(self, box):
+        size = box * box
+        cells = size * size
+        self.box = box
+        self.size = size
+        self.cells = cells
+        self.all_marks = (1 << size) - 1
+        self.mark_bit = [0] + [1 << (n - 1) for n in range(1, size + 1)]
+        # Lookup tables indexed by mark bitmask: number of marks, and the
+        # marks themselves in ascending order.  Full tables up to 16 values
+        # (64k entries); beyond that counts are computed and mark tuples
+        # cached as they turn up, up to a bound
+        if size <= 16:
+            self.bit_count = [bin(m).count("1") for m in range(self.all_marks + 1)]
+        else:
+            self.bit_count = BitCounts()
+        if size <= 9:
+            self.mark_digits = [tuple(n for n in range(1, size + 1) if m & self.mark_bit[n])
+                                for m in range(self.all_marks + 1)]
+        else:
+            self.mark_digits = MarkDigits()
+
+        # Cell indices of each row, column, and grid, in ascending order
+        grid_of = [box * (x // (size * box)) + (x % size) // box for x in range(cells)]
+        self.row_units = tuple(tuple(range(size * i, size * i + size)) for i in range(size))
+        self.column_units = tuple(tuple(range(i, cells, size)) for i in range(size))
+        self.grid_units = tuple(tuple(x for x in range(cells) if grid_of[x] == i)
+                                for i in range(size))
+        # All units, and for each cell the indices into units of its row,
+        # column, and grid
+        self.units = self.row_units + self.column_units + self.grid_units
+        self.cell_units = tuple((x // size, size + x % size, 2 * size + grid_of[x])
+                                for x in range(cells))
+
+        # Other cells sharing a row, column, or grid with each cell
+        self.row_peers, self.column_peers, self.grid_peers = (
+            tuple(tuple(x for x in self.units[self.cell_units[i][k]] if x != i)
+                  for i in range(cells))
+            for k in range(3))
+        # The distinct peers of each cell: row, then column, then the grid
+        # cells sharing neither
+        self.peers = tuple(self.row_peers[i] + self.column_peers[i]
+                           + tuple(x for x in self.grid_peers[i]
+                                   if x // size != i // size and x % size != i % size)
+                           for i in range(cells))
+        # Sets of units are integers, bit u standing for units[u]; these are
+        # the units each cell belongs to
+        self.all_units = (1 << 3 * size) - 1
+        self.cell_unit_bits = tuple((1 << r) | (1 << c) | (1 << g)
+                                    for r, c, g in self.cell_units)
+        # For each grid, its rows and then its columns, each split into the
+        # grid cells on that line and the line cells outside the grid
+        self.grid_lines = tuple(
+            tuple((tuple(x for x in self.units[line] if grid_of[x] == grid),
+                   tuple(x for x in self.units[line] if grid_of[x] != grid))
+                  for line in sorted({self.cell_units[x][0] for x in self.grid_units[grid]})
+                  + sorted({self.cell_units[x][1] for x in self.grid_units[grid]}))
+            for grid in range(size))
+        # For each row and then each column, its grids, each split into the
+        # line cells inside the grid and the grid cells off the line
+        self.line_grids = tuple(
+            tuple((tuple(x for x in self.units[line] if grid_of[x] == grid),
+                   tuple(x for x in self.grid_units[grid]
+                         if self.cell_units[x][line // size] != line))
+                  for grid in sorted({grid_of[x] for x in self.units[line]}))
+            for line in range(2 * size))
+
+
+GEOMETRIES = {}
+
+
+def geometry(box=3):
+    """the shared Geometry for boards of box x box grids"""
+    if box not in GEOMETRIES:
+        if box < 2:
+            raise ValueError("box size must be at least 2, got %r" % box)
+        GEOMETRIES[box] = Geometry(box)
+    return GEOMETRIES[box]
+
+
+# The standard 9x9 board, whose tables the rest of the package imports under
+# these names
+STANDARD = geometry(3)
+ALL_MARKS = STANDARD.all_marks
+MARK_BIT = STANDARD.mark_bit
+BIT_COUNT = STANDARD.bit_count
+MARK_DIGITS = STANDARD.mark_digits
+ROW_UNITS = STANDARD.row_units
+COLUMN_UNITS = STANDARD.column_units
+GRID_UNITS = STANDARD.grid_units
+UNITS = STANDARD.units
+CELL_UNITS = STANDARD.cell_units
+ROW_PEERS = STANDARD.row_peers
+COLUMN_PEERS = STANDARD.column_peers
+GRID_PEERS = STANDARD.grid_peers
+PEERS = STANDARD.peers
+ALL_UNITS = STANDARD.all_units
+CELL_UNIT_BITS = STANDARD.cell_unit_bits
+GRID_LINES = STANDARD.grid_lines
+LINE_GRIDS = STANDARD.line_grids
+
+# Every technique keeps its own set of units left to look at
+TECHNIQUES = ("hidden singles", "pairs", "triples", "quads", "pointing pairs", "claiming")
+SUBSET_TECHNIQUES = {2: "pairs", 3: "triples", 4: "quads"}
+
+
+def marks_from_digits(values):
+    mask = 0
+    for value in values:
+        mask |= 1 << (value - 1)
+    return mask
+
+
+def small_unions(masks, r, bit_count):
+    """(indices, union) for every r of masks whose union has at most r bits
+
+    Groups grow one mask at a time and are dropped as soon as their union
+    passes r bits, so the work follows the groups that can still make a
+    subset rather than every r-combination, which on a 25 value unit can
+    run to thousands per pass.
+    """
+    found = []
+    count = len(masks)
+    if count < r:
+        return found
+
+    def grow(start, group, union):
+        last = len(group) + 1 == r
+        for i in range(start, count - r + len(group) + 1):
+            grown = union | masks[i]
+            if bit_count[grown] <= r:
+                if last:
+                    found.append((group + (i,), grown))
+                else:
+                    grow(i + 1, group + (i,), grown)
+
+    grow(0, (), 0)
+    return found
+
 
 class CellNeighbors:
     """Aggregation of row, column, and grid cells related to a cell"""
 
-    def __init__(self, index):
-        # List cells in the same row
-        row_start = index - index % 9
-        self.row = [x for x in range(row_start, row_start + 9)
-                    if x != index]
-        self.column = [x for x in range(index % 9, 81, 9)
-                       if x != index]
-        self.grid = [x for x in range(81)
-                     if x != index
-                     and self.grid_index(x) == self.grid_index(index)]
+    def __init__(self, index, geometry=STANDARD):
+        # Cells in the same row, column, and grid, from the shared tables
+        self.index = index
+        self.geometry = geometry
+        self.row = geometry.row_peers[index]
+        self.column = geometry.column_peers[index]
+        self.grid = geometry.grid_peers[index]
 
     @staticmethod
-    def grid_index(index):
-        return 3 * (index // 27) + (index % 9) // 3
+    def grid_index(index, geometry=STANDARD):
+        return geometry.cell_units[index][2] - 2 * geometry.size
 
     def aggregate(self):
-        return self.row + self.column + [x for x in self.grid
-                                         if x not in self.row
-                                         and x not in self.column]
+        return self.geometry.peers[self.index]
 
     def info(self):
         print(self.row)
@@ -36,23 +212,39 @@ class CellNeighbors:
 class GridCell:
     """Fundamental cell data element"""
 
-    def __init__(self, index):
-        # When 9x9 grid cell array is row major, divmod() yields cell row and column
-        x = divmod(index, 9)
+    def __init__(self, index, puzzle):
+        # When the grid cell array is row major, divmod() yields cell row and column
+        box = puzzle.geometry.box
+        x = divmod(index, puzzle.geometry.size)
+        self.index = index
         self.row_index = x[0]
         self.column_index = x[1]
-        # Additional fu computes the 3x3 grid index starting from upper left
-        self.grid = 3 * (self.row_index // 3) + self.column_index // 3
-        # List of possible cell values, colloquially "pencil marks"
-        # When cell value is determined, list length is 1
-        self.PencilMarks = list(range(1, 10))
-        # If cell array is considered as graph, each cell has 20 adjacent cells:
+        # Additional fu computes the grid index starting from upper left
+        self.grid = box * (self.row_index // box) + self.column_index // box
+        # Pencil marks and the solved flag live in flat arrays owned by the
+        # puzzle; the cell is a view onto its slot in those arrays
+        self.puzzle = puzzle
+        # If cell array is considered as graph, each cell of a 9x9 board has
+        # 20 adjacent cells:
         # 8 in same row
         # 8 in same column
         # 4 in same 3x3 grid but _not_ in same row or column
-        self.neighbors = CellNeighbors(index)
+        self.neighbors = CellNeighbors(index, puzzle.geometry)
+
+    @property
+    def PencilMarks(self):
+        # List of possible cell values, colloquially "pencil marks"
+        # When cell value is determined, list length is 1
+        return list(self.puzzle.geometry.mark_digits[self.puzzle.marks[self.index]])
+
+    @PencilMarks.setter
+    def PencilMarks(self, values):
+        self.puzzle.set_marks(self.index, marks_from_digits(values))
+
+    @property
+    def solved(self):
         # Flag indicates which cells to include in heuristic solver steps
-        self.solved = False
+        return self.puzzle.solved[self.index]
 
     def info(self):
         print(self.row_index)
@@ -61,197 +253,646 @@ class GridCell:
         self.neighbors.info()
 
     def solve(self, value):
-        self.PencilMarks = [value]
-        self.solved = True
+        self.puzzle.place(self.index, 1 << (value - 1))
 
     def get_value(self):
         # convenience function for console printing
         if self.solved:
-            return self.PencilMarks[0]
+            return self.puzzle.marks[self.index].bit_length()
         else:
             return "X"
 
     def remove_mark(self, value):
-        if value in self.PencilMarks:
-            self.PencilMarks.remove(value)
+        self.puzzle.restrict(self.index, ~(1 << (value - 1)))
 
 
 class Puzzle:
     """encapsulates puzzle solving code"""
 
-    def __init__(self, seed):
-        self.cells = []
-        for i in range(81):
-            self.cells.append(GridCell(i))
-            # cells[i].info()
-        print("Cell Grid Initialized")
+    def __init__(self, seed, stats=None, box=3):
+        # Board shape, 3x3 grids of 9 values unless box says otherwise
+        self.geometry = g = geometry(box)
+        # Candidate bitmask and solved flag for every cell, row major
+        self.marks = [g.all_marks] * g.cells
+        self.solved = [False] * g.cells
+        self._cells = None
+        # Propagation queue.  Cells down to one mark but not yet placed,
+        # units changed since the last look by any technique, and for each
+        # technique the units it still has to look at.  Techniques only
+        # revisit units whose marks changed, never the whole board
+        self.singles = []
+        self.changed = 0
+        self.dirty = dict.fromkeys(TECHNIQUES, g.all_units)
+        # Set as soon as some cell runs out of marks
+        self.broken = False
+        # Optional SolveStats instrumentation; None costs nothing
+        self.stats = stats
+        # perf_counter() time after which search gives up with TimeoutError,
+        # or None to search for as long as it takes
+        self.deadline = None
+        # While next_step() runs, each technique stops after one deduction
+        # and leaves the cells it rested on in step_cells
+        self.stepping = False
+        self.step_cells = None
         for i in seed:
-            # print(i)
-            cell_index = 9 * i[0] + i[1]
-            self.cells[cell_index].solve(i[2])
-            for j in self.cells[cell_index].neighbors.aggregate():
-                # print(j, cells[j].PencilMarks)
-                self.cells[j].remove_mark(i[2])
-                # print(j, cells[j].PencilMarks)
+            cell_index = g.size * i[0] + i[1]
+            self.place(cell_index, g.mark_bit[i[2]])
+
+    @property
+    def cells(self):
+        # GridCell views are only built for callers that ask for them
+        if self._cells is None:
+            self._cells = [GridCell(i, self) for i in range(self.geometry.cells)]
+        return self._cells
+
+    def place(self, index, mark):
+        # Solve a cell and strike its value from the pencil marks of all its
+        # peers.  Returns the number of marks struck
+        g = self.geometry
+        bit_count = g.bit_count
+        cell_unit_bits = g.cell_unit_bits
+        marks = self.marks
+        singles = self.singles
+        marks[index] = mark
+        self.solved[index] = True
+        changed = self.changed | cell_unit_bits[index]
+        removed = 0
+        for j in g.peers[index]:
+            m = marks[j]
+            if m & mark:
+                m ^= mark
+                marks[j] = m
+                changed |= cell_unit_bits[j]
+                removed += 1
+                if bit_count[m] == 1:
+                    singles.append(j)
+                elif not m:
+                    self.broken = True
+        self.changed = changed
+        return removed
+
+    def restrict(self, index, keep):
+        # Cut a cell's marks down to those in keep, returning how many went
+        m = self.marks[index]
+        if m & keep == m:
+            return 0
+        self.set_marks(index, m & keep)
+        bit_count = self.geometry.bit_count
+        return bit_count[m] - bit_count[m & keep]
+
+    def set_marks(self, index, mask):
+        self.marks[index] = mask
+        self.changed |= self.geometry.cell_unit_bits[index]
+        if self.geometry.bit_count[mask] == 1:
+            self.singles.append(index)
+        elif not mask:
+            self.broken = True
+
+    def take_dirty(self, technique):
+        # Units the technique has not looked at since they last changed
+        changed = self.changed
+        if changed:
+            dirty = self.dirty
+            for name in dirty:
+                dirty[name] |= changed
+            self.changed = 0
+        units = self.dirty[technique]
+        self.dirty[technique] = 0
+        return units
 
     def info(self):
-        return [[x.get_value() for x in self.cells[9 * i:9 * (i + 1)]] for i in range(9)]
+        size = self.geometry.size
+        values = self.values()
+        return [values[size * i:size * (i + 1)] for i in range(size)]
+
+    def values(self):
+        # cell values in row major order, "X" where a cell is unsolved
+        return [m.bit_length() if s else "X" for m, s in zip(self.marks, self.solved)]
 
     def dump_marks(self):
         # dump pencil marks
-        for i in range(81):
+        for i in range(self.geometry.cells):
             if self.cells[i].solved:
                 print(i, self.cells[i].PencilMarks[0])
             else:
                 print(i, self.cells[i].PencilMarks)
 
-    def solve(self):
-        puzzle_solved = False
-        working_set = [x for x in self.cells if not x.solved]
-        unsolved_before = len(working_set)
+    def unsolved(self):
+        return [x for x, s in enumerate(self.solved) if not s]
 
-        while not puzzle_solved:
-            # print(self.info())
+    def solve(self):
+        # Logical techniques first; if they stall, search the remaining
+        # pencil marks.  None only when the puzzle has no solution at all
+        if not self.count_solutions(1):
+            return None
+        return self.values()
+
+    def count_solutions(self, limit=2):
+        """number of solutions, counting no further than limit
+
+        Runs the logical techniques and then the same search as solve(),
+        stopping at the limit solution; limit=2 tells a unique puzzle from
+        one with no or many solutions.  The pencil marks are left at the
+        last solution found when the limit is reached.
+        """
+        self.search_nodes = 0
+        if not self.apply_techniques():
+            return 0
+        if not self.unsolved():
+            return 1
+        if self.stats is not None:
+            recorded = self.stats.recorded_seconds
+        start = perf_counter()
+        found = self.search(limit)
+        if self.stats is not None:
+            # the techniques run on each guess are charged to themselves, so
+            # search gets only its own time: guessing, snapshots, and restores
+            self.stats.counter("search").seconds += (
+                perf_counter() - start - (self.stats.recorded_seconds - recorded))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("found %d solutions in %d search nodes", found, self.search_nodes,
+                      extra={"solutions": found, "search_nodes": self.search_nodes})
+        return found
+
+    def apply_techniques(self):
+        # Run singles, subsets, pointing pairs, and claiming until none of
+        # them finds anything new.  Returns False if the pencil marks have
+        # reached a contradiction
+        debug = log.isEnabledFor(logging.DEBUG)
+        while True:
             # deal with hidden and naked singles until none are found
-            new_singles_set = self.process_singles(working_set)
-            if len(new_singles_set) > 0:
-                continue
-
-            working_set = [x for x in self.cells if not x.solved]
-
-            # check for pairs
-            # keep rolling if new singles resulted from pairs checks
-            new_singles_set = self.reduce_r(working_set, 2)
-            if len(new_singles_set) > 0:
-                continue
-
-            # check for triples
-            # keep rolling if new singles resulted from triples checks
-            new_singles_set = self.reduce_r(working_set, 3)
-            if len(new_singles_set) > 0:
-                continue
-
-            # done with this solving iteration -- check progress
-            working_set = [x for x in self.cells if not x.solved]
-            unsolved_after = len(working_set)
-
-            if unsolved_after == unsolved_before:
+            self.process_singles()
+            # keep rolling as long as some technique strikes marks, going
+            # back to singles after each success; quads, the most costly,
+            # only get a turn once everything else has stalled
+            if self.broken or not (self.step("pairs", self.reduce_r, 2)
+                                   or self.step("triples", self.reduce_r, 3)
+                                   or self.step("pointing pairs", self.process_pointing_pairs)
+                                   or self.step("claiming", self.process_claiming)
+                                   or self.step("quads", self.reduce_r, 4)):
+                break
+            if debug:
+                unsolved = len(self.unsolved())
+                log.debug("unsolved: %d", unsolved, extra={"unsolved": unsolved})
+        return not self.broken and self.consistent()
+
+    def next_step(self):
+        """make the next logical deduction, and say what it was
+
+        Techniques are tried in the order solve() uses them, easiest first,
+        and the first with anything to offer makes exactly one deduction:
+        one cell placed, or one subset, pointing pair, or claiming pattern
+        applied.  Returns a dict with the technique, the cells the deduction
+        rests on as [row, column] pairs, the cells it placed and the marks
+        it struck as [row, column, value] lists, and whether the puzzle is
+        now seen to have no solution.  None once no technique finds
+        anything more, or the puzzle is already broken.  The propagation
+        queue carries over between calls, so stepping through a puzzle
+        costs about what solving it does.
+        """
+        if self.broken:
+            return None
+        size = self.geometry.size
+        marks_before = self.marks[:]
+        solved_before = self.solved[:]
+        steps = (("naked singles", self.process_naked_singles, ()),
+                 ("hidden singles", self.process_hidden_singles, ()),
+                 ("pairs", self.reduce_r, (2,)),
+                 ("triples", self.reduce_r, (3,)),
+                 ("pointing pairs", self.process_pointing_pairs, ()),
+                 ("claiming", self.process_claiming, ()),
+                 ("quads", self.reduce_r, (4,)))
+        self.stepping = True
+        try:
+            for technique, method, args in steps:
+                self.step_cells = None
+                self.step(technique, method, *args)
+                if self.step_cells is not None or self.broken:
+                    break
+            else:
                 return None
-            unsolved_before = unsolved_after
-            print("unsolved:" + str(unsolved_after))
-            # print(self.info())
-            puzzle_solved = (unsolved_after == 0)
-        return [self.cells[i].get_value() for i in range(81)]
-
-    def process_pointing_pairs(self, working_set):
-        neighbor_pairs = [p for p in combinations(working_set, 2)
-                          if (p[0].row_index == p[1].row_index
-                              or p[0].column_index == p[1].column_index)
-                          and p[0].grid == p[1].grid]
-        for pair in neighbor_pairs:
-            mutual_neighbors = set.intersection(*[set(p.neighbors.grid) for p in pair])
-            shared_marks = set.union(*[set(p.PencilMarks) for p in pair])
-            mn_marks = [set(self.cells[i].PencilMarks) for i in mutual_neighbors]
-            exclusive_marks = shared_marks - set.union(*mn_marks)
-            pointing_candidate = len(exclusive_marks) == 1
-            if pointing_candidate and pair[0].row_index == pair[1].row_index:
-                # remove the pointing pair symbol from other cells in the row
-                mark = exclusive_marks.pop()
-                for j in set(pair[0].neighbors.row) & set(pair[1].neighbors.row):
-                    self.cells[j].remove_mark(mark)
-
-            elif pointing_candidate and pair[0].column_index == pair[1].column_index:
-                # remove the pointing pair symbol from other cells in the column
-                mark = exclusive_marks.pop()
-                for j in set(pair[0].neighbors.column) & set(pair[1].neighbors.column):
-                    self.cells[j].remove_mark(mark)
-
-    def reduce_r(self, working_set, r):
-        # consider one section (row, column, grid) at a time
-        for i in range(9):
-            working_row = [x for x in working_set if x.row_index == i and len(x.PencilMarks) > 1]
-            for cell_tuple in combinations(working_row, r):
-                shared_marks = set.union(*[set(p.PencilMarks) for p in cell_tuple])
-                mutual_neighbors = set.intersection(*[set(p.neighbors.row) for p in cell_tuple])
-                mn_marks = [set(self.cells[i].PencilMarks) for i in mutual_neighbors]
-                exclusive_marks = shared_marks - set.union(*mn_marks)
-
-                if len(exclusive_marks) == r:
-                    if len(shared_marks) > len(exclusive_marks):
-                        for cell in cell_tuple:
-                            for mark in shared_marks - exclusive_marks:
-                                cell.remove_mark(mark)
-                    else:
-                        for neighbor in mutual_neighbors:
-                            for mark in shared_marks:
-                                self.cells[neighbor].remove_mark(mark)
-
-            working_column = [x for x in working_set if x.column_index == i and len(x.PencilMarks) > 1]
-            for cell_tuple in combinations(working_column, r):
-                shared_marks = set.union(*[set(p.PencilMarks) for p in cell_tuple])
-                mutual_neighbors = set.intersection(*[set(p.neighbors.column) for p in cell_tuple])
-                mn_marks = [set(self.cells[i].PencilMarks) for i in mutual_neighbors]
-                exclusive_marks = shared_marks - set.union(*mn_marks)
-
-                if len(exclusive_marks) == r:
-                    if len(shared_marks) > len(exclusive_marks):
-                        for cell in cell_tuple:
-                            for mark in shared_marks - exclusive_marks:
-                                cell.remove_mark(mark)
-                    else:
-                        for neighbor in mutual_neighbors:
-                            for mark in shared_marks:
-                                self.cells[neighbor].remove_mark(mark)
-
-            working_grid = [x for x in working_set if x.grid == i and len(x.PencilMarks) > 1]
-            for cell_tuple in combinations(working_grid, r):
-                shared_marks = set.union(*[set(p.PencilMarks) for p in cell_tuple])
-                mutual_neighbors = set.intersection(*[set(p.neighbors.grid) for p in cell_tuple])
-                mn_marks = [set(self.cells[i].PencilMarks) for i in mutual_neighbors]
-                exclusive_marks = shared_marks - set.union(*mn_marks)
-
-                if len(exclusive_marks) == r:
-                    if len(shared_marks) > len(exclusive_marks):
-                        for cell in cell_tuple:
-                            for mark in shared_marks - exclusive_marks:
-                                cell.remove_mark(mark)
-                    else:
-                        for neighbor in mutual_neighbors:
-                            for mark in shared_marks:
-                                self.cells[neighbor].remove_mark(mark)
-        self.process_pointing_pairs(working_set)
-        return [y for y in [x for x in self.cells if not x.solved] if len(y.PencilMarks) == 1]
-
-    def process_singles(self, working_set):
-        # seek out and process hidden singles
-        multiple_mark_set = [k for k in working_set if len(k.PencilMarks) > 1]
-        for i in multiple_mark_set:
-            hidden_single = None
-            for j in i.PencilMarks:
-                # is pencil mark j unique in the row, column, or grid?
-                if all(j not in self.cells[k].PencilMarks for k in i.neighbors.row) \
-                        or all(j not in self.cells[k].PencilMarks for k in i.neighbors.column) \
-                        or all(j not in self.cells[k].PencilMarks for k in i.neighbors.grid):
-                    hidden_single = j
+        finally:
+            self.stepping = False
+        cells = self.step_cells or ()
+        if technique == "hidden singles" and not self.broken:
+            # the cell is down to its one mark; place it as part of this step
+            self.place(cells[0], self.marks[cells[0]])
+        step = {"technique": technique, "cells": [list(divmod(x, size)) for x in cells],
+                "placements": [], "eliminations": [], "contradiction": self.broken}
+        for i, (old, new) in enumerate(zip(marks_before, self.marks)):
+            row, column = divmod(i, size)
+            if old != new:
+                step["eliminations"].extend([row, column, n]
+                                            for n in self.geometry.mark_digits[old & ~new])
+            if self.solved[i] and not solved_before[i]:
+                step["placements"].append([row, column, new.bit_length()])
+        return step
+
+    def step(self, technique, method, *args):
+        # Run one technique, through the instrumentation if it is switched on
+        if self.stats is None:
+            return method(*args)
+        return self.stats.record(self, technique, method, args)
+
+    def consistent(self):
+        # Every cell still has a mark and every value still has a home in
+        # each unit.  Placing a value twice in a unit strips it from the
+        # first cell, so repeats show up as empty cells
+        marks = self.marks
+        if 0 in marks:
+            return False
+        all_marks = self.geometry.all_marks
+        for unit in self.geometry.units:
+            seen = 0
+            for x in unit:
+                seen |= marks[x]
+            if seen != all_marks:
+                return False
+        return True
+
+    def search(self, limit=1):
+        # Depth first search from the current pencil marks, guessing on the
+        # unsolved cell with the fewest marks and propagating each guess
+        # with the logical techniques.  Returns the number of solutions
+        # found, stopping as soon as there are limit of them, in which case
+        # the pencil marks are left at the last one.  Node count is kept in
+        # search_nodes.  Past the deadline, if one is set, it raises
+        # TimeoutError and leaves the pencil marks wherever it had got to
+        if self.deadline is not None and perf_counter() > self.deadline:
+            raise TimeoutError("no answer after %d search nodes" % self.search_nodes)
+        g = self.geometry
+        bit_count = g.bit_count
+        marks = self.marks
+        cell = min(self.unsolved(), key=lambda x: bit_count[marks[x]])
+        saved = self.snapshot()
+        found = 0
+        for value in g.mark_digits[marks[cell]]:
+            self.search_nodes += 1
+            if self.stats is not None:
+                self.stats.record_guess(self, cell, value)
+            self.place(cell, g.mark_bit[value])
+            if self.apply_techniques():
+                found += self.search(limit - found) if self.unsolved() else 1
+                if found >= limit:
+                    return found
+            # back to the fixed point the guess was made from
+            self.restore(saved)
+        return found
+
+    def snapshot(self):
+        """the current pencil marks and propagation queue, as a PuzzleState"""
+        return PuzzleState(tuple(self.marks), tuple(self.solved), tuple(self.singles),
+                           self.changed, tuple(self.dirty.values()), self.broken)
+
+    def restore(self, state):
+        """return to a state taken by snapshot(), which stays usable"""
+        # copied into the existing lists, so references held to them stay
+        # live
+        self.marks[:] = state.marks
+        self.solved[:] = state.solved
+        self.singles = list(state.singles)
+        self.changed = state.changed
+        self.dirty = dict(zip(TECHNIQUES, state.dirty))
+        self.broken = state.broken
+
+    def process_pointing_pairs(self):
+        # A value confined to one row or column of a grid can be struck from
+        # the rest of that row or column
+        g = self.geometry
+        box = g.box
+        marks = self.marks
+        solved = self.solved
+        units = self.take_dirty("pointing pairs") >> 2 * g.size
+        removed = 0
+        grid = 0
+        while units and not self.broken:
+            if units & 1:
+                lines = g.grid_lines[grid]
+                line_marks = []
+                for inside, outside in lines:
+                    m = 0
+                    for x in inside:
+                        if not solved[x]:
+                            m |= marks[x]
+                    line_marks.append(m)
+                for k in range(2 * box):
+                    first = k - k % box
+                    others = 0
+                    for j in range(first, first + box):
+                        if j != k:
+                            others |= line_marks[j]
+                    pointing = line_marks[k] & ~others
+                    if pointing:
+                        for x in lines[k][1]:
+                            removed += self.restrict(x, ~pointing)
+                        if self.stepping and removed:
+                            self.step_cells = tuple(x for x in lines[k][0]
+                                                    if not solved[x] and marks[x] & pointing)
+                            self.dirty["pointing pairs"] |= units << 2 * g.size + grid
+                            return removed
+            units >>= 1
+            grid += 1
+        return removed
+
+    def process_claiming(self):
+        # A value confined to one grid within a row or column can be struck
+        # from the rest of that grid
+        g = self.geometry
+        marks = self.marks
+        solved = self.solved
+        units = self.take_dirty("claiming") & (1 << 2 * g.size) - 1
+        removed = 0
+        while units and not self.broken:
+            low = units & -units
+            units ^= low
+            grids = g.line_grids[low.bit_length() - 1]
+            segment_marks = []
+            seen = 0
+            repeated = 0
+            for inside, _ in grids:
+                m = 0
+                for x in inside:
+                    if not solved[x]:
+                        m |= marks[x]
+                segment_marks.append(m)
+                repeated |= seen & m
+                seen |= m
+            for k, m in enumerate(segment_marks):
+                claiming = m & ~repeated
+                if claiming:
+                    for x in grids[k][1]:
+                        removed += self.restrict(x, ~claiming)
+                    if self.stepping and removed:
+                        self.step_cells = tuple(x for x in grids[k][0]
+                                                if not solved[x] and marks[x] & claiming)
+                        self.dirty["claiming"] |= units | low
+                        return removed
+        return removed
+
+    def reduce_r(self, r):
+        # consider one section (row, column, grid) at a time, skipping those
+        # that have not changed since subsets of size r last looked at them
+        all_units = self.geometry.units
+        units = self.take_dirty(SUBSET_TECHNIQUES[r])
+        removed = 0
+        while units and not self.broken:
+            low = units & -units
+            units ^= low
+            removed += self.reduce_unit(all_units[low.bit_length() - 1], r)
+            if self.stepping and removed:
+                self.dirty[SUBSET_TECHNIQUES[r]] |= units | low
+                break
+        return removed
+
+    def reduce_unit(self, unit, r):
+        # Look for r cells of the unit holding r marks between them (a naked
+        # subset, whose marks go from the rest of the unit) and for r marks
+        # found in only r cells (a hidden subset, whose cells lose every
+        # other mark).  Subsets are grown by small_unions() from cells with
+        # at most r marks and from marks held by at most r cells, never from
+        # all cell tuples.  Among n open cells a naked subset of size r is a
+        # hidden one of size n - r and the other way round, so each size
+        # only has to look at units where it is the smaller side: hidden
+        # subsets when n >= 2r, naked ones when n > 2r.  Sizes up to 4 then
+        # catch every subset a 9 cell unit has; bigger boards leave the rest
+        # to search
+        g = self.geometry
+        bit_count = g.bit_count
+        mark_digits = g.mark_digits
+        size = g.size
+        marks = self.marks
+        unit_marks = [marks[x] for x in unit]
+        open_cells = 0
+        for p in range(size):
+            if bit_count[unit_marks[p]] > 1:
+                open_cells |= 1 << p
+        n = bit_count[open_cells]
+        if n < 2 * r:
+            return 0
+        removed = 0
+        # naked subsets
+        small = [p for p in range(size) if open_cells >> p & 1 and bit_count[unit_marks[p]] <= r] \
+            if n > 2 * r else ()
+        for group, _ in small_unions([unit_marks[p] for p in small], r, bit_count):
+            # marks as they are now, earlier groups may have struck some
+            group = [small[i] for i in group]
+            shared_marks = 0
+            for p in group:
+                shared_marks |= unit_marks[p]
+            if bit_count[shared_marks] < r:
+                # r cells with fewer than r values between them
+                self.broken = True
+                return removed
+            if bit_count[shared_marks] > r:
+                continue
+            for p in range(size):
+                if open_cells >> p & 1 and p not in group:
+                    removed += self.restrict(unit[p], ~shared_marks)
+                    unit_marks[p] = marks[unit[p]]
+            if self.stepping and removed:
+                self.step_cells = tuple(unit[p] for p in group)
+                return removed
+        # hidden subsets: unit positions holding each mark, as a bitmask
+        places = [0] * (size + 1)
+        for p in range(size):
+            for n in mark_digits[unit_marks[p]]:
+                places[n] |= 1 << p
+        # marks a cell down to one value still holds cannot be part of a
+        # hidden subset, and would otherwise pair up with each other
+        rare = [x for x in places if 0 < bit_count[x] <= r and not x & ~open_cells]
+        for _, cover in small_unions(rare, r, bit_count):
+            if bit_count[cover] < r:
+                # r marks squeezed into fewer than r cells
+                self.broken = True
+                return removed
+            shared_marks = 0
+            other_marks = 0
+            for p in range(size):
+                if cover >> p & 1:
+                    shared_marks |= unit_marks[p]
+                else:
+                    other_marks |= unit_marks[p]
+            exclusive_marks = shared_marks & ~other_marks
+            if bit_count[exclusive_marks] == r and bit_count[shared_marks] > r:
+                for p in mark_digits[cover]:
+                    removed += self.restrict(unit[p - 1], exclusive_marks)
+                    unit_marks[p - 1] = marks[unit[p - 1]]
+                if self.stepping and removed:
+                    self.step_cells = tuple(unit[p - 1] for p in mark_digits[cover])
+                    return removed
+        return removed
+
+    def process_singles(self):
+        # Alternate naked and hidden singles until neither turns up anything
+        # new.  Returns the number of marks struck
+        removed = 0
+        while not self.broken:
+            removed += self.step("naked singles", self.process_naked_singles)
+            found = self.step("hidden singles", self.process_hidden_singles)
+            if not found:
+                break
+            removed += found
+        return removed
+
+    def process_naked_singles(self):
+        # Place every queued cell that is down to one mark
+        bit_count = self.geometry.bit_count
+        marks = self.marks
+        solved = self.solved
+        singles = self.singles
+        removed = 0
+        while singles and not self.broken:
+            i = singles.pop()
+            if not solved[i] and bit_count[marks[i]] == 1:
+                removed += self.place(i, marks[i])
+                if self.stepping:
+                    self.step_cells = (i,)
                     break
-
-            if hidden_single is not None:
-                i.PencilMarks = [hidden_single]
-        # seek out and process naked singles
-        naked_single_set = [y for y in working_set if len(y.PencilMarks) == 1]
-        # print([x.PencilMarks for x in naked_single_set])
-        for i in naked_single_set:
-            i.solve(i.PencilMarks[0])
-            # print(i.GetValue())
-            for j in i.neighbors.aggregate():
-                # print(j, self.cells[j].PencilMarks)
-                self.cells[j].remove_mark(i.get_value())
-                # print(j, self.cells[j].PencilMarks)
-        new_singles_set = [y for y in [x for x in self.cells if not x.solved] if len(y.PencilMarks) == 1]
-        return new_singles_set
+        return removed
+
+    def process_hidden_singles(self):
+        # Cut a cell down to a mark no other cell of one of its units holds,
+        # looking only at units that changed since the last pass
+        g = self.geometry
+        all_marks = g.all_marks
+        all_units = g.units
+        bit_count = g.bit_count
+        marks = self.marks
+        solved = self.solved
+        units = self.take_dirty("hidden singles")
+        removed = 0
+        while units and not self.broken:
+            low = units & -units
+            units ^= low
+            unit = all_units[low.bit_length() - 1]
+            seen = 0
+            repeated = 0
+            for x in unit:
+                repeated |= seen & marks[x]
+                seen |= marks[x]
+            if seen != all_marks:
+                # some value has nowhere left to go
+                self.broken = True
+                break
+            unique = seen & ~repeated
+            if not unique:
+                continue
+            for x in unit:
+                hidden_singles = marks[x] & unique
+                if hidden_singles and not solved[x]:
+                    if bit_count[hidden_singles] > 1:
+                        self.broken = True
+                        break
+                    removed += self.restrict(x, hidden_singles)
+                    if self.stepping and removed:
+                        self.step_cells = (x,)
+                        # leave the rest for the next step
+                        self.dirty["hidden singles"] |= units | low
+                        return removed
+        return removed
+
+
+class PuzzleState:
+    """Frozen copy of a Puzzle's pencil marks and propagation queue
+
+    Just a handful of flat tuples, so taking one costs a few list copies and
+    no objects per cell.  Being immutable, a state can be restored any
+    number of times and in any order.
+    """
+    __slots__ = ("marks", "solved", "singles", "changed", "dirty", "broken")
+
+    def __init__(self, marks, solved, singles, changed, dirty, broken):
+        self.marks = marks
+        self.solved = solved
+        self.singles = singles
+        self.changed = changed
+        # dirty unit sets in TECHNIQUES order
+        self.dirty = dirty
+        self.broken = broken
+
+
+class TechniqueStats:
+    """Counters for one solving technique"""
+
+    def __init__(self):
+        self.calls = 0
+        self.eliminations = 0
+        # cells whose value the technique settled
+        self.placements = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {"calls": self.calls, "eliminations": self.eliminations,
+                "placements": self.placements, "seconds": self.seconds}
+
+
+class SolveStats:
+    """Opt-in record of per-technique effort, with an optional step trace"""
+
+    def __init__(self, trace=False):
+        self.techniques = {}
+        # One entry per technique run that changed something, and per search
+        # guess, when tracing
+        self.trace = [] if trace else None
+        # wall time spent in record(), technique runs and bookkeeping both
+        self.recorded_seconds = 0.0
+
+    def counter(self, technique):
+        if technique not in self.techniques:
+            self.techniques[technique] = TechniqueStats()
+        return self.techniques[technique]
+
+    def record(self, puzzle, technique, method, args):
+        # Run a technique method, charging its time and results to technique
+        entered = perf_counter()
+        g = puzzle.geometry
+        bit_count = g.bit_count
+        marks = puzzle.marks
+        before = marks[:] if self.trace is not None else None
+        settled = sum(1 for m in marks if bit_count[m] == 1)
+        start = perf_counter()
+        removed = method(*args)
+        elapsed = perf_counter() - start
+        placements = sum(1 for m in marks if bit_count[m] == 1) - settled
+        counter = self.counter(technique)
+        counter.calls += 1
+        counter.eliminations += removed
+        counter.placements += placements
+        counter.seconds += elapsed
+        if self.trace is not None and removed:
+            step = {"technique": technique, "placements": [], "eliminations": []}
+            for i, (old, new) in enumerate(zip(before, marks)):
+                if old != new:
+                    row, column = divmod(i, g.size)
+                    step["eliminations"].extend([row, column, n]
+                                                for n in g.mark_digits[old & ~new])
+                    if bit_count[new] == 1 and bit_count[old] > 1:
+                        step["placements"].append([row, column, new.bit_length()])
+            self.trace.append(step)
+        self.recorded_seconds += perf_counter() - entered
+        return removed
+
+    def record_guess(self, puzzle, index, value):
+        counter = self.counter("search")
+        counter.calls += 1
+        counter.placements += 1
+        if self.trace is not None:
+            row, column = divmod(index, puzzle.geometry.size)
+            self.trace.append({"technique": "search", "placements": [[row, column, value]],
+                               "eliminations": []})
+
+    def as_dict(self):
+        result = {"techniques": {k: v.as_dict() for k, v in self.techniques.items()}}
+        if self.trace is not None:
+            result["trace"] = self.trace
+        return result
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, format="%(message)s")
     print("Hello World")
     # cells = []
     # for i in range(81):
@@ -8,5 +8,6 @@ setup(
     license='',
     author='Craig Blome',
     author_email='',
-    description=''
+    description='',
+    extras_require={'numpy': ['numpy']}
 )
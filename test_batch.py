@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+from SudokuBatch import solve_many
+from test_puzzle import contradiction, hidden_pairs, hidden_pairs_solution, \
+    naked_pairs, naked_pairs_solution, singles_only, singles_only_solution
+
+seeds = [singles_only, naked_pairs, contradiction, hidden_pairs, [(0, 0, 10)]]
+
+
+class TestSolveMany(TestCase):
+    def test_ordered(self):
+        results = list(solve_many(seeds, workers=2, chunksize=2))
+        self.assertEqual([r.index for r in results], [0, 1, 2, 3, 4])
+        self.assertEqual(results[0].solution, singles_only_solution)
+        self.assertEqual(results[1].solution, naked_pairs_solution)
+        self.assertEqual(results[3].solution, hidden_pairs_solution)
+
+    def test_failures(self):
+        results = list(solve_many(seeds, workers=2, chunksize=1))
+        self.assertIsNone(results[2].solution)
+        self.assertEqual(results[2].error, "no solution")
+        self.assertIsNone(results[4].solution)
+        self.assertTrue(results[4].error.startswith("IndexError"))
+
+    def test_unordered(self):
+        results = list(solve_many(iter(seeds * 3), workers=2, chunksize=2, ordered=False))
+        self.assertEqual(sorted(r.index for r in results), list(range(15)))
+        for r in results:
+            self.assertEqual(r.error is None, r.index % 5 in (0, 1, 3))
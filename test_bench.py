@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+import SudokuBench
+from SudokuBench import TIERS, compare, load_tier, run
+
+
+def results(puzzles_per_second, construct_us, reduce_us):
+    return {"tiers": {"easy": {"puzzles": 1, "puzzles_per_second": puzzles_per_second,
+                               "construct_us": construct_us,
+                               "technique_us": {"reduce_r(2)": reduce_us}}}}
+
+
+class TestBench(TestCase):
+    def test_corpus(self):
+        for tier in TIERS:
+            seeds, box = load_tier(tier)
+            self.assertTrue(seeds)
+            self.assertEqual(box, {"16x16": 4, "25x25": 5}.get(tier, 3))
+
+    def test_run(self):
+        sample, SudokuBench.SAMPLE_SECONDS = SudokuBench.SAMPLE_SECONDS, 0.001
+        try:
+            tier = run(["easy"], repeat=1)["tiers"]["easy"]
+        finally:
+            SudokuBench.SAMPLE_SECONDS = sample
+        self.assertEqual(tier["puzzles"], len(load_tier("easy")[0]))
+        self.assertGreater(tier["puzzles_per_second"], 0)
+        self.assertGreater(tier["construct_us"], 0)
+        self.assertEqual(sorted(tier["technique_us"]),
+                         ["process_claiming", "process_pointing_pairs", "process_singles",
+                          "reduce_r(2)", "reduce_r(3)", "reduce_r(4)"])
+
+    def test_compare(self):
+        baseline = results(1000, 50, 20)
+        self.assertEqual(compare(results(900, 55, 22), baseline, 0.25), [])
+        regressions = compare(results(700, 70, 22), baseline, 0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("easy puzzles_per_second"))
+        self.assertTrue(regressions[1].startswith("easy construct_us"))
+        # metrics or tiers missing from the baseline are skipped
+        self.assertEqual(compare(results(1, 1000, 1000), {"tiers": {}}), [])
@@ -0,0 +1,70 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from SudokuCache import SolutionCache, apply_transform, find_transform, grid_from_seed, signature
+from SudokuIO import seed_from_line
+from SudokuSolver import Puzzle
+from test_io import large_line
+from test_puzzle import contradiction, hardest, hardest_solution, naked_pairs, \
+    naked_pairs_solution, singles_only
+
+# transpose, swap the first two bands, reverse the columns of the last
+# stack, and shift every digit up by one
+transform = (True, (3, 4, 5, 0, 1, 2, 6, 7, 8), (0, 1, 2, 3, 4, 5, 8, 7, 6),
+             [0, 2, 3, 4, 5, 6, 7, 8, 9, 1])
+
+
+def moved(seed):
+    grid = apply_transform(grid_from_seed(seed), transform)
+    return [(i // 9, i % 9, v) for i, v in enumerate(grid) if v]
+
+
+class TestSolutionCache(TestCase):
+    def test_transform(self):
+        grid = grid_from_seed(naked_pairs)
+        other = apply_transform(grid, transform)
+        self.assertEqual(signature(grid), signature(other))
+        found = find_transform(grid, other)
+        self.assertEqual(apply_transform(grid, found), other)
+        self.assertIsNone(find_transform(grid, grid_from_seed(singles_only)))
+
+    def test_hits(self):
+        cache = SolutionCache()
+        self.assertEqual(cache.solve(naked_pairs), naked_pairs_solution)
+        self.assertEqual(cache.solve(moved(naked_pairs)),
+                         apply_transform(naked_pairs_solution, transform))
+        self.assertEqual(cache.solve(naked_pairs), naked_pairs_solution)
+        self.assertIsNone(cache.solve(contradiction))
+        self.assertIsNone(cache.solve(moved(contradiction)))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (3, 2, 2))
+
+    def test_large_board(self):
+        # 16x16 boards go straight to the solver
+        cache = SolutionCache()
+        seed = seed_from_line(large_line)
+        self.assertEqual(cache.solve(seed, box=4), Puzzle(seed, box=4).solve())
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_eviction(self):
+        cache = SolutionCache(maxsize=1)
+        cache.solve(naked_pairs)
+        cache.solve(singles_only)
+        cache.solve(naked_pairs)
+        self.assertEqual(cache.stats()["misses"], 3)
+        self.assertEqual(cache.stats()["size"], 1)
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "solutions.db")
+            with SolutionCache(path=path) as cache:
+                cache.solve(hardest)
+                cache.solve(contradiction)
+            with SolutionCache(path=path) as cache:
+                self.assertEqual(cache.solve(moved(hardest)),
+                                 apply_transform(hardest_solution, transform))
+                self.assertIsNone(cache.solve(contradiction))
+                self.assertEqual(cache.solve(hardest), hardest_solution)
+                stats = cache.stats()
+                self.assertEqual((stats["disk_hits"], stats["hits"], stats["misses"]), (2, 1, 0))
@@ -0,0 +1,38 @@
+import random
+from unittest import TestCase
+
+from SudokuGenerator import DIFFICULTIES, generate, generate_many, grade, random_grid
+from SudokuSolver import Puzzle
+
+
+class TestGenerator(TestCase):
+    def test_random_grid(self):
+        grid = random_grid(random.Random(1))
+        self.assertEqual(Puzzle([divmod(i, 9) + (v,) for i, v in enumerate(grid)]).solve(), grid)
+
+    def test_minimal(self):
+        puzzle = generate(rng=random.Random(2))
+        self.assertEqual(Puzzle(puzzle.seed).solve(), puzzle.solution)
+        self.assertEqual(Puzzle(puzzle.seed).count_solutions(), 1)
+        self.assertEqual(grade(puzzle.seed), puzzle.difficulty)
+        for i in range(len(puzzle.seed)):
+            fewer = puzzle.seed[:i] + puzzle.seed[i + 1:]
+            self.assertEqual(Puzzle(fewer).count_solutions(), 2)
+
+    def test_difficulty(self):
+        rng = random.Random(3)
+        for difficulty in ("easy", "hard"):
+            puzzle = generate(difficulty, rng=rng)
+            self.assertEqual(puzzle.difficulty, difficulty)
+            self.assertEqual(grade(puzzle.seed), difficulty)
+        puzzle = generate(logic_only=True, rng=rng)
+        self.assertNotEqual(puzzle.difficulty, "expert")
+        self.assertRaises(ValueError, generate, "fiendish")
+        self.assertRaises(ValueError, generate, "expert", True)
+        self.assertEqual(DIFFICULTIES[-1], "expert")
+
+    def test_generate_many(self):
+        first = list(generate_many(3, workers=2, seed=4))
+        second = list(generate_many(3, workers=1, seed=4))
+        self.assertEqual(first, second)
+        self.assertEqual(len({tuple(p.solution) for p in first}), 3)
@@ -0,0 +1,92 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from SudokuBatch import solve_file
+from SudokuIO import iter_seeds, line_box, line_from_grid, line_from_seed, puzzle_box, \
+    seed_from_line, write_grids
+from SudokuSolver import Puzzle, geometry
+from test_puzzle import naked_pairs, naked_pairs_solution, singles_only, singles_only_solution
+
+singles_only_line = ".8..9.3..3..5..1.8..634....5......74.........71......9....568..6.1..2..7..5.7..3."
+# 16x16 board, values past 9 written A to G
+large_line = ("96..B.7...E..CG.F....69.G..24.....2D..F.37.4..6.73.BD.C.....5..."
+              "...6.7.D.51.E..G...3..2E986B.5.12C.......4.DB...5.A1....C.....7."
+              ".D.42E.FB3..96A51EF25.69DG.C..B...9......12...........GCA6...1.2"
+              "D4G..2E.....6.5F..39..D....6..2..5..9..3.EC....7E21CF5A.4.7G3.8.")
+
+
+class TestPuzzleIO(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name, text=None):
+        path = os.path.join(self.directory.name, name)
+        if text is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return path
+
+    def test_large_board(self):
+        self.assertEqual(line_box(large_line), 4)
+        seed = seed_from_line(large_line)
+        self.assertEqual(line_from_seed(seed, box=4), large_line)
+        self.assertIn((0, 4, 11), seed)
+        solution = Puzzle(seed, box=4).solve()
+        for unit in geometry(4).units:
+            self.assertEqual(sorted(solution[x] for x in unit), list(range(1, 17)))
+        self.assertEqual(len(line_from_grid(solution)), 256)
+        self.assertRaises(ValueError, seed_from_line, large_line.replace("G", "H"))
+
+    def test_line_round_trip(self):
+        self.assertEqual(line_from_seed(singles_only), singles_only_line)
+        self.assertEqual(seed_from_line(singles_only_line), singles_only)
+        self.assertEqual(seed_from_line(singles_only_line.replace(".", "0") + " rating 1.2"),
+                         singles_only)
+        self.assertRaises(ValueError, seed_from_line, singles_only_line[1:])
+        self.assertRaises(ValueError, seed_from_line, singles_only_line.replace(".", "x"))
+
+    def test_read_formats(self):
+        lines = [singles_only_line, line_from_seed(naked_pairs, "0")]
+        expected = [singles_only, naked_pairs]
+        text = "# corpus\n" + "\n".join(lines) + "\n\n"
+        self.assertEqual(list(iter_seeds(self.path("p.txt", text))), expected)
+        self.assertEqual(list(iter_seeds(self.path("p.txt"), use_mmap=False)), expected)
+        sdm = self.path("p.sdm", "\r\n".join(line.replace(".", "0") for line in lines))
+        self.assertEqual(list(iter_seeds(sdm)), expected)
+        csv_text = "quizzes,solutions\n" + "".join(x + ",%s\n" % ("1" * 81) for x in lines)
+        self.assertEqual(list(iter_seeds(self.path("p.csv", csv_text))), expected)
+        self.assertEqual(list(iter_seeds(self.path("p.csv"), column="quizzes")), expected)
+        self.assertEqual(list(iter_seeds(self.path("empty.txt", ""))), [])
+
+    def test_write_formats(self):
+        grids = [singles_only_solution, None]
+        self.assertEqual(write_grids(self.path("out.sdm"), grids), 2)
+        with open(self.path("out.sdm")) as f:
+            self.assertEqual(f.read().split(), [line_from_grid(singles_only_solution), "0" * 81])
+        write_grids(self.path("out.csv"), [(singles_only_line, singles_only_solution)],
+                    header=("quizzes", "solutions"))
+        with open(self.path("out.csv")) as f:
+            self.assertEqual(f.read().split(), ["quizzes,solutions", "%s,%s" % (
+                singles_only_line.replace(".", "0"), line_from_grid(singles_only_solution))])
+
+    def test_solve_file(self):
+        source = self.path("p.txt", "\n".join(line_from_seed(s) for s in
+                                              [singles_only, [(0, 0, 5), (0, 1, 5)], naked_pairs]))
+        self.assertEqual(solve_file(source, self.path("out.txt"), workers=2, chunksize=1), 3)
+        with open(self.path("out.txt")) as f:
+            self.assertEqual(f.read().split(), [line_from_grid(singles_only_solution), "." * 81,
+                                                line_from_grid(naked_pairs_solution)])
+
+    def test_solve_file_large_board(self):
+        # a second 9 in the first row leaves the other puzzle unsolvable
+        broken = "9" + large_line[1:].replace(".", "9", 1)
+        source = self.path("p.txt", "\n".join([large_line, broken]))
+        self.assertEqual(solve_file(source, self.path("out.txt"), workers=2, chunksize=1), 2)
+        with open(self.path("out.txt")) as f:
+            self.assertEqual(f.read().split(), [line_from_grid(Puzzle(seed_from_line(large_line),
+                                                                      box=4).solve()), "." * 256])
+        self.assertEqual(puzzle_box(source), 4)
@@ -0,0 +1,25 @@
+from unittest import TestCase, skipIf
+
+try:
+    import numpy
+    from SudokuNumpy import candidates_from_seeds, propagate, solve_batch
+except ImportError:
+    numpy = None
+
+from test_puzzle import contradiction, hardest, hardest_solution, naked_pairs, \
+    naked_pairs_solution, singles_only, singles_only_1, singles_only_1_solution, \
+    singles_only_solution
+
+
+@skipIf(numpy is None, "numpy is not installed")
+class TestSolveBatch(TestCase):
+    def test_propagate(self):
+        candidates = candidates_from_seeds([singles_only, singles_only_1, contradiction, hardest])
+        solved, broken = propagate(candidates)
+        self.assertEqual(solved.tolist(), [True, True, False, False])
+        self.assertEqual(broken.tolist(), [False, False, True, False])
+
+    def test_solve_batch(self):
+        seeds = [singles_only, contradiction, naked_pairs, singles_only_1, hardest]
+        self.assertEqual(solve_batch(seeds), [singles_only_solution, None, naked_pairs_solution,
+                                              singles_only_1_solution, hardest_solution])
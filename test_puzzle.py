@@ -1,6 +1,11 @@
+import io
+import json
+from contextlib import redirect_stdout
+from time import perf_counter
 from unittest import TestCase
 
-from SudokuSolver import Puzzle
+from SudokuSolver import ALL_UNITS, BIT_COUNT, TECHNIQUES, CellNeighbors, MarkDigits, Puzzle, \
+    SolveStats, geometry, marks_from_digits, small_unions
 
 # Initial grid values as row/column/value tuples
 # This puzzle is solvable with only hidden/naked singles
@@ -132,6 +137,25 @@ twins_and_triples_solution = [4, 7, 1, 6, 3, 5, 2, 8, 9,
                               6, 1, 9, 5, 8, 4, 7, 3, 2]
 
 
+# Needs search once the logical techniques stall
+hardest = [(0, 0, 8), (1, 2, 3), (1, 3, 6), (2, 1, 7), (2, 4, 9), (2, 6, 2),
+           (3, 1, 5), (3, 5, 7), (4, 4, 4), (4, 5, 5), (4, 6, 7), (5, 3, 1), (5, 7, 3),
+           (6, 2, 1), (6, 7, 6), (6, 8, 8), (7, 2, 8), (7, 3, 5), (7, 7, 1),
+           (8, 1, 9), (8, 6, 4)]
+
+hardest_solution = [8, 1, 2, 7, 5, 3, 6, 4, 9,
+                    9, 4, 3, 6, 8, 2, 1, 7, 5,
+                    6, 7, 5, 4, 9, 1, 2, 8, 3,
+                    1, 5, 4, 2, 3, 7, 8, 9, 6,
+                    3, 6, 9, 8, 4, 5, 7, 2, 1,
+                    2, 8, 7, 1, 6, 9, 5, 3, 4,
+                    5, 2, 1, 9, 7, 4, 3, 6, 8,
+                    4, 3, 8, 5, 2, 6, 9, 1, 7,
+                    7, 9, 6, 3, 1, 8, 4, 5, 2]
+
+# Two 5s in the first row
+contradiction = [(0, 0, 5), (0, 8, 5)]
+
 class TestPuzzle(TestCase):
     def test_info(self):
         p = Puzzle(singles_only)
@@ -160,3 +184,204 @@ class TestPuzzle(TestCase):
     def test_solve_2_3(self):
         test_2_3 = Puzzle(twins_and_triples)
         self.assertEqual(test_2_3.solve(), twins_and_triples_solution)
+
+    def test_pencil_marks(self):
+        p = Puzzle(singles_only)
+        self.assertEqual(p.cells[0].PencilMarks, [1, 2, 4])
+        self.assertEqual(p.marks[0], 0b1011)
+        p.cells[0].remove_mark(2)
+        self.assertEqual(p.cells[0].PencilMarks, [1, 4])
+
+    def test_neighbors(self):
+        n = CellNeighbors(0)
+        self.assertEqual(n.row, tuple(range(1, 9)))
+        self.assertEqual(n.column, tuple(range(9, 81, 9)))
+        self.assertEqual(n.grid, (1, 2, 9, 10, 11, 18, 19, 20))
+        self.assertEqual(len(set(n.aggregate())), 20)
+        self.assertEqual(n.aggregate()[-4:], (10, 11, 19, 20))
+        self.assertIs(n.aggregate(), CellNeighbors(0).aggregate())
+
+    def test_solve_search(self):
+        test_hardest = Puzzle(hardest)
+        self.assertEqual(test_hardest.solve(), hardest_solution)
+        self.assertGreater(test_hardest.search_nodes, 0)
+
+    def test_solve_contradiction(self):
+        self.assertIsNone(Puzzle(contradiction).solve())
+
+    def test_count_solutions(self):
+        self.assertEqual(Puzzle(singles_only).count_solutions(), 1)
+        self.assertEqual(Puzzle(hardest).count_solutions(), 1)
+        self.assertEqual(Puzzle(contradiction).count_solutions(), 0)
+        # one clue short of the hardest puzzle leaves it ambiguous
+        self.assertEqual(Puzzle(hardest[1:]).count_solutions(), 2)
+        self.assertEqual(Puzzle([]).count_solutions(limit=5), 5)
+        first = Puzzle(hardest[1:])
+        self.assertEqual(first.count_solutions(limit=1), 1)
+        self.assertNotIn("X", first.values())
+
+    def test_snapshot(self):
+        p = Puzzle(hardest)
+        p.process_singles()
+        state = p.snapshot()
+        marks = p.marks
+        # what if the first open cell held its first mark
+        cell = p.unsolved()[0]
+        p.cells[cell].solve(p.cells[cell].PencilMarks[0])
+        p.apply_techniques()
+        self.assertNotEqual(tuple(p.marks), state.marks)
+        p.restore(state)
+        self.assertIs(p.marks, marks)
+        for name in state.__slots__:
+            self.assertEqual(getattr(p.snapshot(), name), getattr(state, name))
+        self.assertEqual(p.solve(), hardest_solution)
+
+    def test_geometry(self):
+        small = geometry(2)
+        self.assertIs(CellNeighbors(0).geometry, geometry(3))
+        self.assertEqual(small.grid_units[3], (10, 11, 14, 15))
+        self.assertEqual(len(small.peers[0]), 7)
+        self.assertEqual(CellNeighbors.grid_index(15, small), 3)
+        self.assertEqual(len(geometry(5).peers[0]), 64)
+        self.assertRaises(ValueError, geometry, 1)
+
+    def test_mark_digits_bound(self):
+        digits = MarkDigits(maxsize=2)
+        for mask in (0b101, 0b11, 1 << 24 | 1):
+            self.assertEqual(digits[mask], tuple(n + 1 for n in range(25) if mask >> n & 1))
+        self.assertEqual(len(digits), 1)
+        self.assertIsInstance(geometry(5).mark_digits, MarkDigits)
+
+    def test_small_board(self):
+        p = Puzzle([(0, 0, 1), (1, 2, 2), (2, 1, 3)], box=2)
+        self.assertEqual(p.cells[15].grid, 3)
+        self.assertEqual(p.count_solutions(limit=5), 3)
+        p = Puzzle([(0, 0, 1), (1, 2, 2), (2, 1, 3), (3, 3, 4)], box=2)
+        self.assertEqual(p.solve(), [1, 2, 4, 3,
+                                     3, 4, 2, 1,
+                                     4, 3, 1, 2,
+                                     2, 1, 3, 4])
+
+    def test_deadline(self):
+        p = Puzzle(hardest)
+        p.deadline = 0
+        self.assertRaises(TimeoutError, p.solve)
+        # puzzles the logical techniques finish never look at it
+        p = Puzzle(naked_pairs)
+        p.deadline = 0
+        self.assertEqual(p.solve(), naked_pairs_solution)
+
+    def test_dirty_units(self):
+        p = Puzzle(singles_only)
+        self.assertEqual(p.take_dirty("pairs"), ALL_UNITS)
+        self.assertEqual(p.take_dirty("pairs"), 0)
+        p.cells[0].remove_mark(4)
+        # row 0, column 0, and grid 0
+        self.assertEqual(p.take_dirty("pairs"), 1 | 1 << 9 | 1 << 18)
+        self.assertTrue(p.apply_techniques())
+        self.assertEqual([p.take_dirty(t) for t in TECHNIQUES], [0] * len(TECHNIQUES))
+
+    def test_naked_quad(self):
+        p = Puzzle([])
+        quad = marks_from_digits([1, 2, 3, 4])
+        for x in range(4):
+            p.restrict(x, quad)
+        self.assertEqual(p.reduce_r(4), 20)
+        self.assertEqual([p.marks[x] & quad for x in range(4, 9)], [0] * 5)
+
+    def test_small_unions(self):
+        masks = [0b11, 0b110, 0b1, 0b1111, 0b10]
+        self.assertEqual(small_unions(masks, 2, BIT_COUNT),
+                         [((0, 2), 0b11), ((0, 4), 0b11), ((1, 4), 0b110), ((2, 4), 0b11)])
+        self.assertEqual(small_unions(masks[:1], 2, BIT_COUNT), [])
+
+    def test_naked_quad_large_board(self):
+        p = Puzzle([], box=5)
+        quad = marks_from_digits([1, 2, 3, 4])
+        for x in range(4):
+            p.restrict(x, quad)
+        # the quad shares row 0 and grid 0: 21 other cells in the row, 20
+        # more in the grid
+        others = set(range(4, 25)) | {25 * r + c for r in range(1, 5) for c in range(5)}
+        self.assertEqual(p.reduce_r(4), 4 * 41)
+        self.assertEqual([p.marks[x] & quad for x in sorted(others)], [0] * 41)
+
+    def test_hidden_quad(self):
+        p = Puzzle([])
+        quad = marks_from_digits([5, 6, 7, 8])
+        for x in range(4, 9):
+            p.restrict(x, ~quad)
+        self.assertEqual(p.reduce_r(4), 20)
+        self.assertEqual(p.marks[:4], [quad] * 4)
+
+    def test_claiming(self):
+        # 1 confined to grid 0 within row 0 goes from the rest of grid 0
+        p = Puzzle([])
+        for x in range(3, 9):
+            p.cells[x].remove_mark(1)
+        self.assertEqual(p.process_claiming(), 6)
+        self.assertEqual([p.marks[x] & 1 for x in (9, 10, 11, 18, 19, 20)], [0] * 6)
+
+    def test_next_step(self):
+        p = Puzzle([])
+        quad = marks_from_digits([1, 2, 3, 4])
+        for x in range(4):
+            p.restrict(x, quad)
+        step = p.next_step()
+        self.assertEqual(step["technique"], "quads")
+        self.assertEqual(step["cells"], [[0, 0], [0, 1], [0, 2], [0, 3]])
+        self.assertEqual(step["placements"], [])
+        self.assertEqual(len(step["eliminations"]), 20)
+        self.assertIn([0, 4, 1], step["eliminations"])
+        self.assertFalse(step["contradiction"])
+        self.assertIsNone(p.next_step())
+
+    def test_next_step_solve(self):
+        p = Puzzle(naked_pairs)
+        techniques = set()
+        placed = {}
+        step = p.next_step()
+        while step is not None:
+            # one deduction at a time
+            self.assertLessEqual(len(step["placements"]), 1)
+            techniques.add(step["technique"])
+            for row, column, value in step["placements"]:
+                placed[9 * row + column] = value
+            step = p.next_step()
+        self.assertIn("pairs", techniques)
+        self.assertEqual(p.values(), naked_pairs_solution)
+        self.assertTrue(all(naked_pairs_solution[i] == v for i, v in placed.items()))
+
+    def test_stats(self):
+        stats = SolveStats(trace=True)
+        test_singles = Puzzle(singles_only, stats=stats)
+        # cells already down to one mark once the clues are placed
+        settled = [bin(m).count("1") for m in test_singles.marks].count(1)
+        self.assertEqual(test_singles.solve(), singles_only_solution)
+        counts = stats.as_dict()["techniques"]
+        self.assertEqual(sum(t["placements"] for t in counts.values()), 81 - settled)
+        self.assertNotIn("search", counts)
+        trace = json.loads(stats.to_json())["trace"]
+        placed = [tuple(p) for step in trace for p in step["placements"]]
+        self.assertEqual(len(placed), 81 - settled)
+        for row, column, value in placed:
+            self.assertEqual(singles_only_solution[9 * row + column], value)
+
+    def test_stats_search(self):
+        stats = SolveStats()
+        test_hardest = Puzzle(hardest, stats=stats)
+        start = perf_counter()
+        test_hardest.solve()
+        elapsed = perf_counter() - start
+        self.assertEqual(stats.techniques["search"].calls, test_hardest.search_nodes)
+        self.assertGreater(stats.techniques["pairs"].calls, 0)
+        # no time is charged twice
+        self.assertGreater(stats.techniques["search"].seconds, 0)
+        self.assertLessEqual(sum(t.seconds for t in stats.techniques.values()), elapsed)
+
+    def test_quiet(self):
+        out = io.StringIO()
+        with redirect_stdout(out), self.assertLogs("SudokuSolver", "DEBUG") as logs:
+            Puzzle(naked_pairs).solve()
+        self.assertEqual(out.getvalue(), "")
+        self.assertTrue(all(hasattr(r, "unsolved") for r in logs.records))
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import IsolatedAsyncioTestCase
+
+from SudokuIO import line_from_grid, line_from_seed
+from SudokuService import ServiceBusy, SolveService, handle_http, serve_lines, solve_async
+from test_puzzle import contradiction, hardest, hardest_solution, naked_pairs, \
+    naked_pairs_solution
+
+
+class TestSolveService(IsolatedAsyncioTestCase):
+    def service(self, workers=1, **kwargs):
+        executor = ThreadPoolExecutor(workers)
+        self.addCleanup(executor.shutdown)
+        return SolveService(workers, executor=executor, **kwargs)
+
+    async def test_solve(self):
+        service = self.service()
+        self.assertEqual(await service.solve(naked_pairs), naked_pairs_solution)
+        self.assertIsNone(await service.solve(contradiction))
+        stats = service.stats()
+        self.assertEqual((stats["solved"], stats["unsolvable"], stats["running"]), (1, 1, 0))
+
+    async def test_process_pool(self):
+        async with SolveService(workers=2) as service:
+            results = await asyncio.gather(solve_async(hardest, 30, service=service),
+                                           solve_async(naked_pairs, 30, service=service))
+        self.assertEqual(results, [hardest_solution, naked_pairs_solution])
+
+    async def test_coalesce(self):
+        service = self.service()
+        results = await asyncio.gather(*[service.solve(list(hardest)) for _ in range(5)])
+        self.assertEqual(results, [hardest_solution] * 5)
+        stats = service.stats()
+        self.assertEqual((stats["coalesced"], stats["solved"], stats["in_flight"]), (4, 1, 0))
+
+    async def test_coalesce_mixed_timeouts(self):
+        # the first caller's timeout is its own, not the shared solve's
+        service = self.service()
+        impatient, patient = await asyncio.gather(service.solve(hardest, timeout=1e-4),
+                                                  service.solve(hardest), return_exceptions=True)
+        self.assertIsInstance(impatient, asyncio.TimeoutError)
+        self.assertEqual(patient, hardest_solution)
+        stats = service.stats()
+        self.assertEqual((stats["coalesced"], stats["timeouts"], stats["deadlines"]), (1, 1, 0))
+
+    async def test_solve_after_cancel(self):
+        service = self.service()
+        first = asyncio.ensure_future(service.solve(hardest))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        # the cancelled solve is still winding down; this one starts its own
+        self.assertEqual(await service.solve(hardest), hardest_solution)
+        stats = service.stats()
+        self.assertEqual((stats["cancelled"], stats["coalesced"], stats["in_flight"]), (1, 0, 0))
+
+    async def test_deadline(self):
+        service = self.service(solve_timeout=1e-9)
+        with self.assertRaises(TimeoutError):
+            await service.solve(hardest)
+        # no search needed, so the deadline never comes up
+        self.assertEqual(await service.solve(naked_pairs), naked_pairs_solution)
+        self.assertEqual(service.stats()["deadlines"], 1)
+
+    async def test_timeout_while_waiting(self):
+        service = self.service()
+        first = asyncio.ensure_future(service.solve(hardest))
+        await asyncio.sleep(0)
+        with self.assertRaises(asyncio.TimeoutError):
+            await service.solve(naked_pairs, timeout=1e-6)
+        self.assertEqual(await first, hardest_solution)
+        # the second solve may have got the worker just before its caller
+        # gave up, and holds it until it finishes
+        while service.running:
+            await asyncio.sleep(0.01)
+        stats = service.stats()
+        self.assertEqual((stats["timeouts"], stats["waiting"]), (1, 0))
+        self.assertEqual(stats["peak_waiting"], 1)
+
+    async def test_busy(self):
+        service = self.service(max_pending=1)
+        first = asyncio.ensure_future(service.solve(hardest))
+        await asyncio.sleep(0)
+        with self.assertRaises(ServiceBusy):
+            await service.solve(naked_pairs)
+        # the same puzzle joins the pending solve instead
+        self.assertEqual(await service.solve(hardest), hardest_solution)
+        await first
+        self.assertEqual(service.stats()["rejected"], 1)
+
+    async def test_serve_lines(self):
+        lines = [line_from_seed(hardest), "# comment", "123", line_from_seed(contradiction),
+                 line_from_seed(naked_pairs)]
+        out = []
+        await serve_lines(self.service(2, max_pending=2), lines, out.append)
+        self.assertEqual(out[0], line_from_grid(hardest_solution))
+        self.assertTrue(out[1].startswith("error: expected"))
+        self.assertEqual(out[2:], ["error: no solution", line_from_grid(naked_pairs_solution)])
+
+    async def test_serve_lines_interactive(self):
+        answered = threading.Event()
+
+        def lines():
+            yield line_from_seed(naked_pairs)
+            # the first answer comes out while input is still awaited
+            self.assertTrue(answered.wait(5))
+            yield line_from_seed(hardest)
+
+        def write(answer):
+            out.append(answer)
+            answered.set()
+
+        out = []
+        await serve_lines(self.service(), lines(), write)
+        self.assertEqual(out, [line_from_grid(naked_pairs_solution),
+                               line_from_grid(hardest_solution)])
+
+    async def test_serve_lines_write_error(self):
+        def write(answer):
+            raise BrokenPipeError
+
+        lines = [line_from_seed(naked_pairs)] * 3
+        with self.assertRaises(BrokenPipeError):
+            await serve_lines(self.service(max_pending=1), lines, write)
+
+    async def test_serve_lines_timeout(self):
+        out = []
+        await serve_lines(self.service(), [line_from_seed(hardest)], out.append, timeout=1e-6)
+        self.assertEqual(out, ["error: timed out"])
+
+    async def http(self, service, request):
+        # (status, json reply) for one raw request to a server on service
+        server = await asyncio.start_server(lambda r, w: handle_http(service, r, w),
+                                            "127.0.0.1", 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname())
+            writer.write(request)
+            response = await reader.read()
+            writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+
+    async def test_http(self):
+        service = self.service()
+
+        def post(line, query=""):
+            return b"POST /solve%s HTTP/1.0\r\nContent-Length: %d\r\n\r\n%s" % (
+                query.encode("ascii"), len(line), line.encode("ascii"))
+
+        self.assertEqual(await self.http(service, post(line_from_seed(naked_pairs))),
+                         (200, {"solution": line_from_grid(naked_pairs_solution)}))
+        self.assertEqual(await self.http(service, post(line_from_seed(contradiction))),
+                         (200, {"solution": None}))
+        status, reply = await self.http(service, post("123"))
+        self.assertEqual(status, 400)
+        self.assertTrue(reply["error"].startswith("expected"))
+        self.assertEqual(await self.http(service, post(line_from_seed(hardest), "?timeout=1e-6")),
+                         (504, {"error": "timed out"}))
+        self.assertEqual((await self.http(service, b"GET /nowhere HTTP/1.0\r\n\r\n"))[0], 404)
+        self.assertEqual((await self.http(service, b"nonsense\r\n\r\n"))[0], 400)
+        status, reply = await self.http(service, b"GET /stats HTTP/1.0\r\n\r\n")
+        self.assertEqual(status, 200)
+        self.assertEqual((reply["solved"], reply["unsolvable"], reply["timeouts"]), (1, 1, 1))
+
+    async def test_http_worker_failure(self):
+        service = self.service()
+        service.executor.shutdown()
+        line = line_from_seed(naked_pairs)
+        status, reply = await self.http(service, b"POST /solve HTTP/1.0\r\nContent-Length: %d"
+                                                 b"\r\n\r\n%s" % (len(line), line.encode("ascii")))
+        self.assertEqual(status, 500)
+        self.assertTrue(reply["error"].startswith("RuntimeError"))
+        stats = service.stats()
+        self.assertEqual((stats["errors"], stats["running"]), (1, 0))